@@ -0,0 +1,69 @@
+"""
+Long-note benchmark: translation latency by note length, whole vs chunked
+
+Translates notes of increasing length with the in-process local provider
+(LLM_PROVIDER=local), whose response time grows with the number of words
+it generates, like a real model's. Each length is run with chunking off
+(LLM_CHUNK_TOKENS=0, one request) and with chunking at the given
+concurrencies, and the wall-clock time of each is printed. Chunked
+latency should grow with chunks / concurrency, not with note length.
+
+The cache is disabled so every run reaches the provider.
+
+Usage:
+    python benchmarks/bench_chunking.py [--paragraphs 1 4 8 16] [--concurrency 1 4 8]
+        [--chunk-tokens 200] [--token-ms 2] [--latency-ms 100]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARAGRAPH = (
+    'We reviewed the quarterly roadmap with the whole team. Sync ships first, then sharing. '
+    'Design needs two more weeks for the editor, and the API freeze moves to the end of the month. '
+    'Everyone agreed to write up open questions before Friday.'
+)
+
+
+def note(paragraphs):
+    return '\n\n'.join(f'{i + 1}. {PARAGRAPH}' for i in range(paragraphs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--chunk-tokens', type=int, default=200)
+    parser.add_argument('--token-ms', type=float, default=2, help='Local provider delay per generated word')
+    parser.add_argument('--latency-ms', type=float, default=100, help='Local provider delay per request')
+    args = parser.parse_args()
+
+    os.environ.update({
+        'LLM_PROVIDER': 'local',
+        'LLM_CACHE_ENABLED': '0',
+        'LOCAL_LLM_LATENCY_MS': str(args.latency_ms),
+        'LOCAL_LLM_TOKEN_MS': str(args.token_ms),
+    })
+    sys.path.insert(0, ROOT)
+    from src import chunking, llm_async
+
+    columns = ['whole'] + [f'x{n}' for n in args.concurrency]
+    print(f'{"paragraphs":>10} {"chars":>7} {"chunks":>6} ' + ' '.join(f'{c:>8}' for c in columns))
+    for paragraphs in args.paragraphs:
+        text = note(paragraphs)
+        chunks = len(chunking.split_text(text, args.chunk_tokens))
+        timings = []
+        for chunk_tokens, concurrency in [(0, 1)] + [(args.chunk_tokens, n) for n in args.concurrency]:
+            chunking.LLM_CHUNK_TOKENS = chunk_tokens
+            llm_async.LLM_CHUNK_CONCURRENCY = concurrency
+            start = time.perf_counter()
+            llm_async.run_blocking(llm_async.atranslate(text, 'French'))
+            timings.append(time.perf_counter() - start)
+        print(f'{paragraphs:>10} {len(text):>7} {chunks:>6} ' + ' '.join(f'{t * 1000:>6.0f}ms' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Accuracy and speed benchmark for the rule-based extractor (src/quick_extract.py)
+
+Runs quick_extract over a labelled corpus of quick captures and longer
+notes, with "now" fixed to Friday 17-Oct-2025 as in the LLM prompt's
+examples, and reports:
+
+    - date and time precision (values produced that are right) and recall
+      (expected values that were found)
+    - how many inputs are answered without the LLM, and how many of those
+      should not have been (false local answers)
+    - per-input latency of the rules
+    - prompt bytes saved by the compact prompt and by skipped LLM calls
+
+With --min-precision it exits non-zero when date or time precision drops
+below the threshold, so it can gate CI when rules are added.
+
+Each corpus line is {"text", "date", "time", "local"}, where date and
+time are what a correct extraction gives ("" for none) and local says
+whether the input is short and unambiguous enough to skip the LLM.
+
+Usage:
+    python benchmarks/bench_quick_extract.py [--corpus benchmarks/fixtures/quick_extract.jsonl]
+        [--repeat 200] [--verbose] [--min-precision 0.95]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import llm  # noqa: E402
+from src.quick_extract import quick_extract  # noqa: E402
+
+NOW = datetime(2025, 10, 17, 9, 0)
+DEFAULT_CORPUS = os.path.join(ROOT, 'benchmarks', 'fixtures', 'quick_extract.jsonl')
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def prompt_bytes(messages):
+    return sum(len(message['content'].encode('utf-8')) for message in messages)
+
+
+def score(found, expected):
+    """Return (produced, correct, expected_count, recalled) for one field of one input"""
+    return (
+        int(bool(found)),
+        int(bool(found) and found == expected),
+        int(bool(expected)),
+        int(bool(expected) and found == expected),
+    )
+
+
+def ratio(part, whole):
+    return part / whole if whole else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=200, help='Timed runs per input')
+    parser.add_argument('--verbose', action='store_true', help='Print every input that was wrong')
+    parser.add_argument('--min-precision', type=float, help='Fail below this date or time precision')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    totals = {field: [0, 0, 0, 0] for field in ('date', 'time')}
+    local = false_local = missed_local = 0
+    full_bytes = planned_bytes = 0
+    timings = []
+
+    for item in corpus:
+        text = item['text']
+        quick = quick_extract(text, now=NOW)
+        for field, found in (('date', quick.event_date), ('time', quick.event_time)):
+            for i, value in enumerate(score(found, item[field])):
+                totals[field][i] += value
+
+        full = prompt_bytes(llm.extraction_messages(text, 'English'))
+        full_bytes += full
+        if quick.complete:
+            local += 1
+            false_local += not item['local']
+        else:
+            missed_local += item['local']
+            if quick.has_when and not quick.unresolved:
+                planned_bytes += prompt_bytes(llm.compact_extraction_messages(text, 'English', quick))
+            else:
+                planned_bytes += full
+
+        wrong = quick.event_date != item['date'] or quick.event_time != item['time']
+        if args.verbose and (wrong or quick.complete != item['local']):
+            print(f'  {text!r}: got {quick.event_date!r} {quick.event_time!r} local={quick.complete}, '
+                  f'expected {item["date"]!r} {item["time"]!r} local={item["local"]}')
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            quick_extract(text, now=NOW)
+        timings.append((time.perf_counter() - start) / args.repeat * 1e6)
+
+    print(f'Corpus: {len(corpus)} inputs ({os.path.relpath(args.corpus, ROOT)})')
+    precision = {}
+    for field, (produced, correct, expected, recalled) in totals.items():
+        precision[field] = ratio(correct, produced)
+        print(f'  {field:5s} precision {precision[field]:6.1%} ({correct}/{produced})   '
+              f'recall {ratio(recalled, expected):6.1%} ({recalled}/{expected})')
+    expected_local = sum(item['local'] for item in corpus)
+    print(f'  answered locally  {local}/{len(corpus)} ({ratio(local, len(corpus)):.1%}); '
+          f'false local {false_local}, missed local {missed_local} of {expected_local}')
+    print(f'  latency           p50 {percentile(timings, 0.5):.1f} us   p95 {percentile(timings, 0.95):.1f} us   '
+          f'max {max(timings):.1f} us')
+    print(f'  prompt bytes      {planned_bytes} of {full_bytes} sent '
+          f'({1 - ratio(planned_bytes, full_bytes):.1%} saved)')
+
+    if args.min_precision is not None:
+        failing = [field for field, value in precision.items() if value < args.min_precision]
+        if failing:
+            sys.exit(f'Precision below {args.min_precision:.0%} for: {", ".join(failing)}')
+
+
+if __name__ == '__main__':
+    main()
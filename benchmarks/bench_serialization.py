@@ -0,0 +1,107 @@
+"""
+Micro-benchmark: serializing the note list
+
+Seeds N notes (default 10k) into a temporary SQLite database and compares
+rows/sec for:
+  before   ORM objects + Note.to_dict() + stdlib json (the old GET /api/notes)
+  rows     selected-column Rows + stdlib json (IsoJSONProvider)
+  orjson   selected-column Rows + orjson (OrjsonProvider), if installed
+plus the full GET /api/notes request with each provider.
+
+Usage:
+    python benchmarks/bench_serialization.py [--notes 10000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert, select
+
+from src.json_provider import IsoJSONProvider, OrjsonProvider, orjson
+from src.main import create_app
+from src.models.note import Note, db
+
+
+def seed(count):
+    rows = [
+        {
+            'title': f'Note {i}',
+            'content': f'Content of note {i}. ' * 20,
+            'tags': 'work, ideas',
+            'event_date': '18-Oct-2025',
+            'event_time': '17:00',
+        }
+        for i in range(count)
+    ]
+    for start in range(0, count, 1000):
+        db.session.execute(insert(Note), rows[start:start + 1000])
+    db.session.commit()
+
+
+def best_of(repeat, fn, reset=None):
+    timings = []
+    for _ in range(repeat):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--notes', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmpdir, "bench.db")}'})
+    from src.routes.note import NOTE_COLUMNS
+
+    with app.app_context():
+        from src.migrations import upgrade_schema
+        upgrade_schema()
+        seed(args.notes)
+        stdlib = DefaultJSONProvider(app)
+        iso = IsoJSONProvider(app)
+
+        def before():
+            notes = Note.query.order_by(Note.updated_at.desc(), Note.id.desc()).all()
+            stdlib.dumps([note.to_dict() for note in notes])
+
+        def rows_with(provider):
+            def run():
+                rows = db.session.execute(select(*NOTE_COLUMNS).order_by(Note.updated_at.desc(), Note.id.desc()))
+                provider.dumps([Note.row_to_dict(row) for row in rows])
+            return run
+
+        cases = [('before (ORM + to_dict + json)', before), ('rows + json', rows_with(iso))]
+        if orjson is not None:
+            cases.append(('rows + orjson', rows_with(OrjsonProvider(app))))
+
+        print(f'{args.notes} notes, best of {args.repeat}')
+        baseline = None
+        for name, fn in cases:
+            # Start each run with an empty identity map, as a fresh request would
+            elapsed = best_of(args.repeat, fn, reset=db.session.expunge_all)
+            baseline = baseline or elapsed
+            print(f'  {name:32s} {args.notes / elapsed:>12,.0f} rows/sec  ({baseline / elapsed:.1f}x)')
+
+    client = app.test_client()
+    providers = [('GET /api/notes, stdlib json', IsoJSONProvider(app))]
+    if orjson is not None:
+        providers.append(('GET /api/notes, orjson', OrjsonProvider(app)))
+    for name, provider in providers:
+        app.json = provider
+        elapsed = best_of(args.repeat, lambda: client.get('/api/notes'))
+        print(f'  {name:32s} {args.notes / elapsed:>12,.0f} rows/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Cold-start benchmark: importing the Vercel entry point
+
+Runs `python -X importtime -c "import api.index"` in fresh interpreters, as
+a Vercel cold start would, and reports the wall-clock time to a ready app
+plus the slowest imports. With --max-ms or --baseline it exits non-zero on a
+regression, so it can gate CI.
+
+The entry point is imported with VERCEL=1 and SCHEMA_INIT=lazy by default,
+matching production where no schema work happens at import time.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--top 15] [--max-ms 1500]
+    python benchmarks/bench_startup.py --save benchmarks/startup_baseline.json
+    python benchmarks/bench_startup.py --baseline benchmarks/startup_baseline.json [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should stay out of a cold start; importing any of them is reported
+DEFERRED_MODULES = ('openai', 'aiohttp', 'src.llm', 'src.llm_async', 'src.hf_helpers')
+
+
+def run_once(env):
+    """Import api.index in a fresh interpreter; return (seconds, {module: cumulative_us})"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import api.index'],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.exit(f'Import failed:\n{result.stderr[-2000:]}')
+    modules = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return elapsed, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    parser.add_argument('--max-ms', type=float, help='Fail if the median start time exceeds this')
+    parser.add_argument('--baseline', help='JSON file from --save to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown vs baseline (0.2 = 20%%)')
+    parser.add_argument('--save', help='Write the median start time to this JSON file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('VERCEL', '1')
+    env.setdefault('SCHEMA_INIT', 'lazy')
+
+    # One warm-up run so .pyc compilation is not counted
+    run_once(env)
+    timings, modules = [], {}
+    for _ in range(args.runs):
+        elapsed, modules = run_once(env)
+        timings.append(elapsed)
+    median_ms = statistics.median(timings) * 1000
+
+    print(f'import api.index: median {median_ms:.0f} ms, min {min(timings) * 1000:.0f} ms over {args.runs} runs')
+    print('Slowest imports (cumulative, last run):')
+    top_level = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+    for name, cumulative in top_level[:args.top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+    loaded = [name for name in DEFERRED_MODULES if name in modules]
+    if loaded:
+        print(f'Warning: imported at startup but meant to be deferred: {", ".join(loaded)}')
+
+    failed = False
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f'FAIL: {median_ms:.0f} ms exceeds --max-ms {args.max_ms:.0f}')
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_ms = json.load(f)['median_ms']
+        limit = baseline_ms * (1 + args.tolerance)
+        print(f'Baseline {baseline_ms:.0f} ms, limit {limit:.0f} ms')
+        if median_ms > limit:
+            print(f'FAIL: {median_ms:.0f} ms is more than {args.tolerance:.0%} slower than the baseline')
+            failed = True
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'median_ms': round(median_ms, 1), 'runs': args.runs, 'python': sys.version.split()[0]}, f, indent=2)
+            f.write('\n')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Local stand-in for the Hugging Face Inference API and OpenAI chat completions
+
+Serves the two HTTP APIs the app calls, with deterministic answers and a
+configurable delay, so the LLM routes can be load-tested without network
+access. Point the app at it with:
+
+    HF_API_KEY=fake HF_API_URL=http://127.0.0.1:<port>/models/
+
+or, for the OpenAI path, OPENAI_API_KEY=fake OPENAI_API_BASE=http://127.0.0.1:<port>/v1
+
+Both accept "stream": true and then answer with server-sent events.
+Unlike LLM_PROVIDER=local, this exercises the real HTTP clients, connection
+pools and retry adapters.
+
+Usage as a module:
+    with FakeLLMServer(latency=0.05) as server:
+        print(server.hf_url)
+
+or standalone:
+    python benchmarks/fake_llm.py [--port 8765] [--latency-ms 50]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        # Same answers as the in-process provider (LLM_PROVIDER=local). Imported
+        # here so importing this module doesn't load src.llm before callers
+        # have set the environment it reads
+        from src.local_llm import answer
+
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        if self.path.startswith('/models/'):
+            inputs = body.get('inputs', '')
+            if body.get('stream') and isinstance(inputs, str):
+                # text-generation-inference style: one event per token
+                self._send_events({'token': {'text': token, 'special': False}}
+                                  for token in re.findall(r'\S+\s*|\s+', answer(inputs)))
+                return
+            if isinstance(inputs, list):
+                result = [[{'generated_text': answer(item)}] for item in inputs]
+            else:
+                result = [{'generated_text': answer(inputs)}]
+        elif self.path.rstrip('/').endswith('/chat/completions'):
+            prompt = '\n'.join(message.get('content', '') for message in body.get('messages', []))
+            if body.get('stream'):
+                tokens = re.findall(r'\S+\s*|\s+', answer(prompt))
+                self._send_events([{'choices': [{'index': 0, 'delta': {'content': token}}]} for token in tokens]
+                                  + ['[DONE]'])
+                return
+            result = {
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': answer(prompt)}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            }
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_events(self, events):
+        """Send server-sent events and close the connection"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for event in events:
+            data = event if isinstance(event, str) else json.dumps(event)
+            self.wfile.write(f'data: {data}\n\n'.encode())
+            self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeLLMServer:
+    """Threaded fake provider server, usable as a context manager"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def hf_url(self):
+        return f'{self.base_url}/models/'
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    args = parser.parse_args()
+    server = FakeLLMServer(port=args.port, latency=args.latency_ms / 1000)
+    print(f'Fake LLM provider on {server.base_url} (HF_API_URL={server.hf_url})')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Partial note updates for the editor's autosave
+
+PATCH /api/notes/<id> carries only the fields that changed, plus the
+version of the note the client last saw. patch_note() writes them with a
+single UPDATE ... WHERE id = ? AND version = ? RETURNING ..., without
+loading the note first, and bumps the version. If the note was changed
+in the meantime (another tab, another device), nothing is written and
+VersionConflictError is raised instead of overwriting it.
+
+The ORM flush hooks don't see this UPDATE, so patch_note() keeps
+event_at, note_tag and the note's embedding in step itself, and only
+when the fields they derive from were sent.
+
+Saves to the same note that overlap in time are coalesced by
+save_coalescer: while one save is being written, further saves of that
+note queue up, and the queue is then written with one UPDATE instead of
+one per save. Saves are never held back once nothing is being written,
+so every acknowledged save is committed.
+
+Environment variables:
+    NOTE_SAVE_COALESCE_MS: Extra wait before writing a save, so more saves
+        of the same note can join it (default 0)
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from sqlalchemy import delete, select, update
+
+from src.models.note import Note, parse_event_at
+from src.models.tag import attach_tags, note_tag
+from src.semantic_search import EMBED_ON_WRITE, store_embeddings
+
+# Fields a PATCH may change
+PATCH_FIELDS = ('title', 'content', 'tags', 'event_date', 'event_time')
+
+
+class VersionConflictError(Exception):
+    """The note's version is no longer the one the save was based on"""
+
+    def __init__(self, note_id, expected, current):
+        super().__init__(f'Note {note_id} was changed elsewhere: version {current["version"]}, not {expected}')
+        self.current = current
+
+
+def parse_patch(data):
+    """
+    Validate a PATCH body
+
+    Returns:
+        (fields, version): the fields to write, and the expected version or
+        None to write whatever the current version is
+
+    Raises:
+        ValueError: The body is not a valid patch
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    unknown = sorted(set(data) - set(PATCH_FIELDS) - {'version'})
+    if unknown:
+        raise ValueError(f'Unknown field: {unknown[0]}')
+    fields = {key: data[key] for key in PATCH_FIELDS if key in data}
+    if not fields:
+        raise ValueError('No fields to update')
+    if isinstance(fields.get('tags'), list):
+        fields['tags'] = ', '.join(str(tag) for tag in fields['tags'])
+    for key, value in fields.items():
+        if value is None and key != 'title':
+            fields[key] = ''
+        elif not isinstance(value, str):
+            raise ValueError(f'{key} must be a string')
+    if 'title' in fields and (not fields['title'].strip() or len(fields['title']) > 200):
+        raise ValueError('Title must be 1 to 200 characters')
+    version = data.get('version')
+    if version is not None and (isinstance(version, bool) or not isinstance(version, int)):
+        raise ValueError('version must be an integer')
+    return fields, version
+
+
+def patch_note(session, note_id, fields, version=None, count=1):
+    """
+    Write some fields of one note in a single UPDATE, then refresh what derives from them
+
+    Args:
+        session: Session or Connection; the caller commits
+        note_id: Note to update
+        fields: {column: value} for columns in PATCH_FIELDS
+        version: Version the change is based on, or None to skip the check
+        count: Saves this write stands for; the version goes up by this much
+
+    Returns:
+        The updated note as a dict of its columns
+
+    Raises:
+        LookupError: No such note
+        VersionConflictError: The note is no longer at version
+    """
+    note = Note.__table__
+    values = dict(fields, version=note.c.version + count)
+    both_event_fields = 'event_date' in fields and 'event_time' in fields
+    if both_event_fields:
+        values['event_at'] = parse_event_at(fields['event_date'], fields['event_time'])
+    stmt = update(note).where(note.c.id == note_id)
+    if version is not None:
+        stmt = stmt.where(note.c.version == version)
+    row = session.execute(stmt.values(**values).returning(*note.c)).first()
+    if row is None:
+        current = session.execute(select(*note.c).where(note.c.id == note_id)).first()
+        if current is None:
+            raise LookupError(f'Note {note_id} not found')
+        raise VersionConflictError(note_id, version, current._asdict())
+    result = row._asdict()
+
+    if not both_event_fields and ('event_date' in fields or 'event_time' in fields):
+        # The other half came from the row, so event_at can only be worked out now
+        event_at = parse_event_at(result['event_date'], result['event_time'])
+        if event_at != result['event_at']:
+            session.execute(
+                update(note).where(note.c.id == note_id)
+                .values(event_at=event_at, updated_at=note.c.updated_at)
+            )
+            result['event_at'] = event_at
+    if 'tags' in fields:
+        session.execute(delete(note_tag).where(note_tag.c.note_id == note_id))
+        attach_tags(session, [(note_id, result['tags'])])
+    if EMBED_ON_WRITE and ('title' in fields or 'content' in fields):
+        try:
+            # SAVEPOINT, as on ORM writes: a failure undoes only the embedding
+            with session.begin_nested():
+                store_embeddings(session, [(note_id, result['title'], result['content'])])
+        except Exception as e:
+            # The search backfill will embed the note later
+            print(f"Warning: Could not embed note {note_id}: {e}")
+    return result
+
+
+class _Save:
+    def __init__(self, fields, version):
+        self.fields = fields
+        self.version = version
+        self.future = Future()
+
+
+# Passed to a queued save whose turn it is to write
+_LEAD = object()
+
+
+class SaveCoalescer:
+    """Per-process queue of saves per note, written as few UPDATEs as possible"""
+
+    def __init__(self, window=0.0):
+        self.window = window
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.stats = {'saves': 0, 'writes': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(window=float(os.getenv('NOTE_SAVE_COALESCE_MS', 0)) / 1000)
+
+    def _take(self, queue):
+        """
+        Remove and return the saves at the head of queue that can be written as one
+
+        Unversioned saves join an unversioned head. Versioned saves join if
+        they continue the head's chain: the k-th save after a head based on
+        version v must be based on v + k, as it would be if each had been
+        written on its own. Anything else is left for a write of its own.
+        """
+        head = queue.popleft()
+        group = [head]
+        while queue:
+            save = queue[0]
+            if head.version is None:
+                joins = save.version is None
+            else:
+                joins = save.version == head.version + len(group)
+            if not joins:
+                break
+            group.append(queue.popleft())
+        return group
+
+    def save(self, note_id, fields, version, write):
+        """
+        Save fields of one note, merged with any other saves of it waiting to be written
+
+        Args:
+            note_id: Note being saved
+            fields: {column: value} to write
+            version: Version the save is based on, or None
+            write: write(fields, version, count) performs the UPDATE and
+                commits; it runs on the thread of one of the merged saves
+
+        Returns:
+            write()'s result, shared by every save written with this one
+        """
+        save = _Save(fields, version)
+        with self._lock:
+            self.stats['saves'] += 1
+            queue = self._queues.get(note_id)
+            leader = queue is None
+            if leader:
+                queue = self._queues[note_id] = deque()
+            queue.append(save)
+        if not leader and save.future.result() is not _LEAD:
+            return save.future.result()
+
+        if self.window:
+            time.sleep(self.window)
+        with self._lock:
+            group = self._take(queue)
+            self.stats['writes'] += 1
+        merged = {}
+        for member in group:
+            merged.update(member.fields)
+        error = result = None
+        try:
+            result = write(merged, group[0].version, len(group))
+        except Exception as e:
+            error = e
+        with self._lock:
+            if queue:
+                # Saves that arrived meanwhile are written next, by the first of them
+                queue[0].future.set_result(_LEAD)
+            else:
+                del self._queues[note_id]
+        for member in group[1:]:
+            if error is not None:
+                member.future.set_exception(error)
+            else:
+                member.future.set_result(result)
+        if error is not None:
+            raise error
+        return result
+
+
+save_coalescer = SaveCoalescer.from_env()
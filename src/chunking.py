@@ -0,0 +1,157 @@
+"""
+Splitting long notes into pieces the LLM can handle in one call
+
+Translation asks for at most 300 new tokens and structured notes for
+500, so a long note sent whole comes back truncated or times out. Notes
+over LLM_CHUNK_TOKENS are instead split into chunks, each chunk is sent
+as its own request (several at once, see src/llm_async.py), and the
+results are put back together: translations in the original order with
+the original paragraph breaks, extractions merged into one title, tag
+list and event date.
+
+Chunks end on paragraph boundaries where possible, then on sentence
+boundaries, then between words; only text with no spaces or sentence
+punctuation at all is cut mid-word. Tokens are estimated, not counted:
+one per CJK character and one per four other characters, which errs on
+the long side for English.
+
+Environment variables:
+    LLM_CHUNK_TOKENS: Estimated input tokens per chunk (default 200, 0 = never split)
+"""
+import json
+import math
+import os
+import re
+
+LLM_CHUNK_TOKENS = int(os.getenv('LLM_CHUNK_TOKENS', 200))
+CHARS_PER_TOKEN = 4
+
+_CJK_RE = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+# Separators tried in order, each kept so the note's layout can be restored
+_SPLITTERS = [
+    re.compile(r'(\n\s*\n)'),
+    re.compile(r'((?<=[.!?])\s+|(?<=[。！？])\s*)'),
+    re.compile(r'(\s+)'),
+]
+
+
+def estimate_tokens(text):
+    """Rough token count of text for any tokenizer"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def _pieces(text, max_tokens, level=0):
+    """Split text into (piece, separator) pairs of at most max_tokens, using the coarsest separator that works"""
+    if estimate_tokens(text) <= max_tokens:
+        return [(text, '')]
+    if level == len(_SPLITTERS):
+        # One character is never more than one estimated token
+        return [(text[start:start + max_tokens], '') for start in range(0, len(text), max_tokens)]
+    parts = _SPLITTERS[level].split(text)
+    pieces = []
+    for i in range(0, len(parts), 2):
+        part = parts[i]
+        separator = parts[i + 1] if i + 1 < len(parts) else ''
+        if not part:
+            if pieces:
+                pieces[-1] = (pieces[-1][0], pieces[-1][1] + separator)
+            continue
+        sub = _pieces(part, max_tokens, level + 1)
+        sub[-1] = (sub[-1][0], sub[-1][1] + separator)
+        pieces.extend(sub)
+    return pieces
+
+
+def split_text(text, max_tokens=None):
+    """
+    Split text into chunks of at most max_tokens estimated tokens
+
+    Args:
+        text: Text to split
+        max_tokens: Budget per chunk (default LLM_CHUNK_TOKENS; 0 never splits)
+
+    Returns:
+        List of (chunk, separator) pairs, where separator is the whitespace
+        that followed the chunk; joining chunk + separator gives back the
+        stripped text. Text within the budget is a single chunk.
+    """
+    max_tokens = LLM_CHUNK_TOKENS if max_tokens is None else max_tokens
+    text = text.strip()
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return [(text, '')]
+
+    chunks = []
+    current, current_tokens, pending = '', 0, ''
+    for piece, separator in _pieces(text, max_tokens):
+        # Estimates of parts add up to at least the estimate of the whole
+        tokens = estimate_tokens(piece)
+        gap = estimate_tokens(pending)
+        if current and current_tokens + gap + tokens > max_tokens:
+            chunks.append((current, pending))
+            current, current_tokens = piece, tokens
+        elif current:
+            current += pending + piece
+            current_tokens += gap + tokens
+        else:
+            current, current_tokens = piece, tokens
+        pending = separator
+    chunks.append((current, ''))
+    return chunks
+
+
+def join_chunks(outputs, chunks):
+    """Join per-chunk outputs with the separators the chunks had in the original text"""
+    return ''.join(output.strip() + separator for output, (_, separator) in zip(outputs, chunks)).strip()
+
+
+def merge_extractions(responses, max_tags=3):
+    """
+    Merge the structured-notes JSON of each chunk of one note
+
+    The title comes from the first chunk, which usually says what the note
+    is about. Notes are joined in order. Tags are the ones most chunks
+    agree on, earlier chunks breaking ties. Event Date and Event Time come
+    from the first chunk that has a date, else the first that has a time.
+
+    Args:
+        responses: Raw model responses, one per chunk, in order
+        max_tags: Most tags to keep
+
+    Returns:
+        JSON string in the shape of a single response; if no chunk answered
+        with a JSON object, the raw responses joined by blank lines
+    """
+    results = []
+    for response in responses:
+        try:
+            data = json.loads(response)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(data, dict):
+            results.append(data)
+    if not results:
+        return '\n\n'.join(responses)
+
+    tags = {}
+    for data in results:
+        chunk_tags = data.get('Tags') or []
+        if isinstance(chunk_tags, str):
+            chunk_tags = [chunk_tags]
+        for tag in dict.fromkeys(str(tag).strip() for tag in chunk_tags if str(tag).strip()):
+            key = tag.lower()
+            if key in tags:
+                tags[key][0] += 1
+            else:
+                tags[key] = [1, len(tags), tag]
+    ranked = sorted(tags.values(), key=lambda entry: (-entry[0], entry[1]))
+
+    when = next((data for data in results if data.get('Event Date')), None)
+    when = when or next((data for data in results if data.get('Event Time')), {})
+    return json.dumps({
+        'Title': next((data['Title'] for data in results if data.get('Title')), ''),
+        'Notes': ' '.join(str(data['Notes']).strip() for data in results if data.get('Notes')),
+        'Tags': [tag for _, _, tag in ranked[:max_tags]],
+        'Event Date': when.get('Event Date', ''),
+        'Event Time': when.get('Event Time', ''),
+    }, ensure_ascii=False)
@@ -0,0 +1,91 @@
+"""
+Database connection pool settings
+
+DB_POOL_MODE picks how connections are managed:
+    serverless: NullPool, one short-lived connection per checkout. Each Vercel
+        instance then holds no idle connections, and DATABASE_URL should point
+        at Supabase's transaction-mode pooler (port 6543), which multiplexes
+        them onto a few server connections. Default when VERCEL is set.
+    queue: a QueuePool sized for a long-running server (gunicorn). Default
+        elsewhere.
+
+Environment variables:
+    DB_POOL_MODE: "serverless" or "queue"
+    DB_POOL_SIZE, DB_MAX_OVERFLOW: QueuePool size (default 5 and 10)
+    DB_POOL_TIMEOUT: Seconds to wait for a free connection (default 10)
+    DB_POOL_RECYCLE: Reconnect connections older than this (default 300)
+    DB_POOL_PRE_PING: "1" tests each connection on checkout, a round trip per
+        request (default on in queue mode, off in serverless mode where
+        every connection is new)
+    DB_QUERY_CACHE_SIZE: SQLAlchemy compiled-statement cache entries
+        (default 500; 0 disables)
+"""
+import os
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+POOL_MODES = ('serverless', 'queue')
+
+
+def _flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def is_postgres(database_url):
+    """True for any PostgreSQL URL, whatever its driver (postgresql+psycopg2:// etc.)"""
+    return make_url(database_url).get_backend_name() in ('postgresql', 'postgres')
+
+
+def default_pool_mode():
+    return 'serverless' if os.environ.get('VERCEL') else 'queue'
+
+
+def engine_options(database_url, mode=None):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS for database_url
+
+    Args:
+        database_url: SQLAlchemy URL of the database
+        mode: "serverless" or "queue"; defaults to DB_POOL_MODE, then to
+            serverless on Vercel and queue elsewhere
+
+    Returns:
+        Dict of create_engine() keyword arguments
+    """
+    mode = mode or os.environ.get('DB_POOL_MODE') or default_pool_mode()
+    if mode not in POOL_MODES:
+        raise ValueError(f"DB_POOL_MODE must be one of {', '.join(POOL_MODES)}, not {mode!r}")
+
+    options = {
+        'query_cache_size': int(os.environ.get('DB_QUERY_CACHE_SIZE', 500)),
+    }
+    connect_args = {}
+    if is_postgres(database_url):
+        # sslmode is set on the URL itself by create_app
+        connect_args = {'connect_timeout': 10}
+        # psycopg2 never prepares statements server-side, so it is safe behind a
+        # transaction pooler as is; psycopg 3 must be told not to
+        if mode == 'serverless' and make_url(database_url).drivername == 'postgresql+psycopg':
+            connect_args['prepare_threshold'] = None
+
+    if mode == 'serverless':
+        options['poolclass'] = NullPool
+        options['pool_pre_ping'] = _flag('DB_POOL_PRE_PING', False)
+    else:
+        options.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 300)),
+            'pool_pre_ping': _flag('DB_POOL_PRE_PING', True),
+            # Reuse the most recently returned connection, leaving surplus ones
+            # idle long enough for the server's idle timeout to close them
+            'pool_use_lifo': True,
+        })
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
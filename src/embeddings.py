@@ -0,0 +1,126 @@
+"""
+Pluggable text embedders for semantic search
+
+EMBEDDER selects the implementation:
+    hashing (default): signed feature hashing of words and character
+        trigrams. Pure Python, offline, no model download. It matches
+        related word forms and typos ("badminton" / "badmington") but knows
+        nothing about meaning.
+    sentence-transformers: a small local CPU model (EMBEDDING_MODEL,
+        default "all-MiniLM-L6-v2") that does capture meaning, so "sports
+        at PolyU" finds a note about badminton. Needs the optional
+        sentence-transformers package.
+
+Vectors are L2-normalized float32, so a dot product is the cosine
+similarity. They are NumPy arrays when NumPy is installed and
+array('f') otherwise; to_blob()/from_blob() convert either to the raw
+float32 bytes stored in note_embedding.
+
+Environment variables:
+    EMBEDDER: "hashing" or "sentence-transformers"
+    EMBEDDING_DIM: Hashing embedder dimensions (default 512)
+    EMBEDDING_MODEL: sentence-transformers model name
+"""
+import math
+import os
+import re
+import threading
+import zlib
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional speed-up
+    np = None
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def to_blob(vector):
+    """Return the float32 bytes of a vector"""
+    if np is not None:
+        return np.asarray(vector, dtype=np.float32).tobytes()
+    return array('f', vector).tobytes()
+
+
+def from_blob(blob):
+    """Return a vector from float32 bytes written by to_blob()"""
+    if np is not None:
+        return np.frombuffer(blob, dtype=np.float32)
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector
+
+
+def note_text(title, content):
+    # The title is short and usually says what the note is about; count it twice
+    return f'{title}\n{title}\n{content}'
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words (weight 1) and character trigrams (weight 0.5)"""
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _features(self, text):
+        for word in _WORD_RE.findall(text.lower()):
+            yield word, 1.0
+            padded = f'#{word}#'
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def embed_one(self, text):
+        values = [0.0] * self.dim
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            # One bit of the hash picks the sign, so collisions tend to cancel out
+            values[h % self.dim] += weight if (h >> 31) & 1 else -weight
+        # Sublinear term frequency, then unit length
+        values = [math.copysign(math.log1p(abs(v)), v) for v in values]
+        norm = math.sqrt(sum(v * v for v in values))
+        if norm:
+            values = [v / norm for v in values]
+        return np.asarray(values, dtype=np.float32) if np is not None else array('f', values)
+
+    def embed(self, texts):
+        return [self.embed_one(text) for text in texts]
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model; loaded on first use"""
+
+    def __init__(self, model_name='all-MiniLM-L6-v2'):
+        self.model_name = model_name
+        self.name = f'st-{model_name}'
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name, device='cpu')
+            return self._model
+
+    def embed(self, texts):
+        vectors = self._get_model().encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return [vector.astype('float32') for vector in vectors]
+
+
+_embedder = None
+
+
+def get_embedder():
+    """Return the configured embedder (created once per process)"""
+    global _embedder
+    if _embedder is None:
+        kind = os.getenv('EMBEDDER', 'hashing').lower()
+        if kind in ('sentence-transformers', 'sentence_transformers', 'st'):
+            _embedder = SentenceTransformerEmbedder(os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+        elif kind == 'hashing':
+            _embedder = HashingEmbedder(int(os.getenv('EMBEDDING_DIM', 512)))
+        else:
+            raise ValueError(f'Unknown EMBEDDER: {kind}')
+    return _embedder
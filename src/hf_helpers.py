@@ -1,14 +1,169 @@
 """
 Hugging Face Inference API helpers
 """
+import json
 import os
+import threading
+import time
+from collections import deque
+
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import Retry
+
+from src.metrics import observe_llm
 
 load_dotenv()
 
 HF_API_KEY = os.getenv("HF_API_KEY")
-HF_API_URL = "https://api-inference.huggingface.co/models/"
+# Overridable so benchmarks can point at a local fake (benchmarks/fake_llm.py)
+HF_API_URL = os.getenv("HF_API_URL", "https://api-inference.huggingface.co/models/")
+
+# Connection pool and retry settings for the shared session
+HF_POOL_SIZE = int(os.getenv("HF_POOL_SIZE", 10))
+HF_BACKOFF_FACTOR = float(os.getenv("HF_BACKOFF_FACTOR", 2.0))
+HF_BACKOFF_MAX = float(os.getenv("HF_BACKOFF_MAX", 20))  # Cap each wait at 20 seconds
+HF_CONNECT_TIMEOUT = float(os.getenv("HF_CONNECT_TIMEOUT", 10))
+HF_READ_TIMEOUT = float(os.getenv("HF_READ_TIMEOUT", 30))
+HF_TIMING_LOG = os.getenv("HF_TIMING_LOG", "").lower() in ("1", "true", "yes")
+
+# Per-phase timings of recent calls: connect, ttfb and total in seconds
+recent_timings = deque(maxlen=100)
+
+# Time spent opening a new connection during the current thread's request
+_connect_time = threading.local()
+
+
+class _TimedConnectMixin:
+    """Records how long connect() takes (DNS + TCP + TLS) for the calling thread"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_time.value = getattr(_connect_time, "value", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections report their connect time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class _HFRetry(Retry):
+    """
+    Retry that waits out a 503 "model loading" for as long as HF estimates
+
+    HF sends estimated_time in the JSON body rather than a Retry-After
+    header, so it is read here before the pool drains the response. Every
+    wait is capped at HF_BACKOFF_MAX (set here, as backoff_max only exists
+    in urllib3 2).
+    """
+
+    estimated_time = None
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        # Raises once attempts run out, leaving the last body for raise_for_status
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if response is not None and response.status == 503:
+            try:
+                retry.estimated_time = float(json.loads(response.data).get("estimated_time"))
+                print(f"Model loading, waiting {retry.get_backoff_time():.1f}s... (attempt {len(retry.history)})")
+            except (TypeError, ValueError, AttributeError):
+                pass
+        return retry
+
+    def get_backoff_time(self):
+        if self.estimated_time is not None:
+            return min(self.estimated_time, HF_BACKOFF_MAX)
+        return min(super().get_backoff_time(), HF_BACKOFF_MAX)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(retry_count=3):
+    """
+    Return the shared keep-alive session for Hugging Face calls
+
+    Connections are pooled (HF_POOL_SIZE per host) and reused across
+    requests in a warm worker. Retries with exponential backoff for
+    timeouts, 429 and 5xx are handled by the adapter; a 503 "model loading"
+    waits for the estimated_time in its body instead (see _HFRetry).
+
+    Args:
+        retry_count: Total attempts per request, as in hf_call_model
+
+    Returns:
+        requests.Session, safe to share between threads
+    """
+    session = _sessions.get(retry_count)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        if retry_count not in _sessions:
+            retries = _HFRetry(
+                total=retry_count - 1,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["POST"]),
+                backoff_factor=HF_BACKOFF_FACTOR,
+                respect_retry_after_header=True,
+                raise_on_status=False,  # Hand the last response to raise_for_status
+            )
+            adapter = _TimedHTTPAdapter(
+                pool_connections=HF_POOL_SIZE,
+                pool_maxsize=HF_POOL_SIZE,
+                max_retries=retries,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Connection": "keep-alive"})
+            _sessions[retry_count] = session
+        return _sessions[retry_count]
+
+
+def record_timing(model, status, connect, ttfb, total):
+    timing = {
+        "model": model,
+        "status": status,
+        "connect": round(connect, 4),
+        "ttfb": round(ttfb, 4),
+        "total": round(total, 4),
+        "reused_connection": connect == 0.0,
+    }
+    recent_timings.append(timing)
+    observe_llm("huggingface", model, total, status if status is not None else "error")
+    if HF_TIMING_LOG:
+        print(f"HF call {model}: status={status} connect={connect:.3f}s ttfb={ttfb:.3f}s total={total:.3f}s")
+    return timing
+
 
 def hf_call_model(model, payload, retry_count=3):
     """
@@ -17,7 +172,7 @@ def hf_call_model(model, payload, retry_count=3):
     Args:
         model: Model name in format "owner/model"
         payload: Dictionary with model-specific parameters
-        retry_count: Number of retries if model is loading
+        retry_count: Number of attempts if the model is loading or the call fails
     
     Returns:
         API response as dict or string
@@ -27,50 +182,32 @@ def hf_call_model(model, payload, retry_count=3):
     
     headers = {"Authorization": f"Bearer {HF_API_KEY}"}
     api_url = f"{HF_API_URL}{model}"
+    session = get_session(retry_count)
     
-    for attempt in range(retry_count):
-        try:
-            response = requests.post(api_url, headers=headers, json=payload, timeout=30)
-            
-            # Handle model loading state
-            if response.status_code == 503:
-                result = response.json()
-                if "estimated_time" in result:
-                    # Model is loading, wait and retry
-                    import time
-                    wait_time = min(result.get("estimated_time", 20), 20)  # Cap at 20 seconds
-                    print(f"Model loading, waiting {wait_time}s... (attempt {attempt + 1}/{retry_count})")
-                    time.sleep(wait_time)
-                    continue
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.Timeout:
-            if attempt < retry_count - 1:
-                continue
-            raise Exception(f"Request timed out after {retry_count} attempts")
-        except requests.exceptions.RequestException as e:
-            if attempt < retry_count - 1 and response.status_code in [503, 429]:
-                import time
-                time.sleep(5)
-                continue
-            raise Exception(f"Hugging Face API error: {str(e)} - Status: {response.status_code if 'response' in locals() else 'N/A'}")
-    
-    raise Exception(f"Failed to get response from model after {retry_count} attempts")
+    _connect_time.value = 0.0
+    start = time.perf_counter()
+    status = None
+    ttfb = 0.0
+    try:
+        # stream=True returns once headers arrive, which gives us time to first byte
+        response = session.post(
+            api_url, headers=headers, json=payload, stream=True,
+            timeout=(HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT)
+        )
+        ttfb = time.perf_counter() - start
+        status = response.status_code
+        body = response.content
+        response.raise_for_status()
+        return response.json() if body else None
+    except requests.exceptions.Timeout:
+        raise Exception(f"Request timed out after {retry_count} attempts")
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Hugging Face API error: {str(e)} - Status: {status if status is not None else 'N/A'}")
+    finally:
+        record_timing(model, status, _connect_time.value, ttfb, time.perf_counter() - start)
 
-def hf_generate(prompt, max_new_tokens=200, temperature=0.7):
-    """
-    Generate text using a Hugging Face language model
-    
-    Args:
-        prompt: Input text prompt
-        max_new_tokens: Maximum number of tokens to generate
-        temperature: Sampling temperature (0.0 to 1.0)
-    
-    Returns:
-        Generated text as string
-    """
+def generation_request(prompt, max_new_tokens=200, temperature=0.7):
+    """Return (model, payload) for a text generation call"""
     model = os.getenv("HF_MODEL", "google/flan-t5-large")
     
     payload = {
@@ -81,9 +218,10 @@ def hf_generate(prompt, max_new_tokens=200, temperature=0.7):
             "return_full_text": False
         }
     }
-    
-    response = hf_call_model(model, payload)
-    
+    return model, payload
+
+def parse_generation(response):
+    """Extract the generated text from a text generation response"""
     # Handle different response formats
     if isinstance(response, list) and len(response) > 0:
         if isinstance(response[0], dict) and "generated_text" in response[0]:
@@ -97,18 +235,78 @@ def hf_generate(prompt, max_new_tokens=200, temperature=0.7):
     
     raise Exception(f"Unexpected response format: {response}")
 
-def hf_translate(text, source_lang="en", target_lang="es"):
+def hf_generate(prompt, max_new_tokens=200, temperature=0.7):
     """
-    Translate text using Hugging Face translation model
+    Generate text using a Hugging Face language model
     
     Args:
-        text: Text to translate
-        source_lang: Source language code (default: "en")
-        target_lang: Target language code (default: "es")
+        prompt: Input text prompt
+        max_new_tokens: Maximum number of tokens to generate
+        temperature: Sampling temperature (0.0 to 1.0)
     
     Returns:
-        Translated text as string
+        Generated text as string
     """
+    model, payload = generation_request(prompt, max_new_tokens, temperature)
+    return parse_generation(hf_call_model(model, payload))
+
+def hf_generate_stream(prompt, max_new_tokens=200, temperature=0.7):
+    """
+    Generate text, yielding it in pieces as the model produces them
+
+    Sends "stream": true, which text-generation-inference models answer
+    with server-sent events carrying one token each. Models without
+    streaming support send the usual JSON body, yielded as one piece.
+
+    Args:
+        prompt: Input text prompt
+        max_new_tokens: Maximum number of tokens to generate
+        temperature: Sampling temperature (0.0 to 1.0)
+
+    Yields:
+        Generated text pieces
+    """
+    if not HF_API_KEY:
+        raise ValueError("HF_API_KEY environment variable must be set")
+
+    model, payload = generation_request(prompt, max_new_tokens, temperature)
+    payload["stream"] = True
+    headers = {"Authorization": f"Bearer {HF_API_KEY}"}
+    api_url = f"{HF_API_URL}{model}"
+
+    _connect_time.value = 0.0
+    start = time.perf_counter()
+    status = None
+    ttfb = 0.0
+    try:
+        with get_session().post(
+            api_url, headers=headers, json=payload, stream=True,
+            timeout=(HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT)
+        ) as response:
+            ttfb = time.perf_counter() - start
+            status = response.status_code
+            response.raise_for_status()
+            if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                yield parse_generation(response.json())
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if event.get("error"):
+                    raise Exception(f"Hugging Face API error: {event['error']}")
+                token = event.get("token") or {}
+                if token.get("text") and not token.get("special"):
+                    yield token["text"]
+    except requests.exceptions.Timeout:
+        raise Exception("Request timed out")
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Hugging Face API error: {str(e)} - Status: {status if status is not None else 'N/A'}")
+    finally:
+        record_timing(model, status, _connect_time.value, ttfb, time.perf_counter() - start)
+
+def translation_request(text, target_lang="es"):
+    """Return (model, payload) for a translation call"""
     model = os.getenv("HF_TRANSLATION_MODEL", "Helsinki-NLP/opus-mt-mul-en")
     
     # For opus-mt models, the input format depends on the model variant
@@ -126,9 +324,10 @@ def hf_translate(text, source_lang="en", target_lang="es"):
             payload = {"inputs": f">>{target_lang}<< {text}"}
         else:
             payload = {"inputs": text}
-    
-    response = hf_call_model(model, payload)
-    
+    return model, payload
+
+def parse_translation(response):
+    """Extract the translated text from a translation response"""
     # Handle different response formats
     if isinstance(response, list) and len(response) > 0:
         if isinstance(response[0], dict) and "translation_text" in response[0]:
@@ -145,20 +344,40 @@ def hf_translate(text, source_lang="en", target_lang="es"):
     
     raise Exception(f"Unexpected translation response format: {response}")
 
-def hf_chat_completion(messages, temperature=0.7, max_new_tokens=500):
+def parse_batch(response, count, parse_item):
     """
-    Simulate chat completion using text generation model
-    Converts chat messages into a prompt for text generation
+    Split a response to a list of inputs into one parsed result per input
+
+    Args:
+        response: API response for a payload whose "inputs" was a list
+        count: Number of inputs sent
+        parse_item: parse_generation or parse_translation
+
+    Returns:
+        List of strings in input order
+    """
+    if not isinstance(response, list) or len(response) != count:
+        raise Exception(f"Unexpected batch response format: {response}")
+    # Each entry is either a single result dict or a list of candidates
+    return [parse_item(item if isinstance(item, list) else [item]) for item in response]
+
+def hf_translate(text, source_lang="en", target_lang="es"):
+    """
+    Translate text using Hugging Face translation model
     
     Args:
-        messages: List of message dicts with 'role' and 'content'
-        temperature: Sampling temperature
-        max_new_tokens: Maximum tokens to generate
+        text: Text to translate
+        source_lang: Source language code (default: "en")
+        target_lang: Target language code (default: "es")
     
     Returns:
-        Generated response text
+        Translated text as string
     """
-    # Convert chat messages to a single prompt
+    model, payload = translation_request(text, target_lang)
+    return parse_translation(hf_call_model(model, payload))
+
+def chat_prompt(messages):
+    """Convert chat messages into a single prompt for text generation"""
     prompt_parts = []
     for msg in messages:
         role = msg.get("role", "user")
@@ -170,6 +389,19 @@ def hf_chat_completion(messages, temperature=0.7, max_new_tokens=500):
         elif role == "assistant":
             prompt_parts.append(f"Assistant: {content}")
     
-    prompt = "\n".join(prompt_parts) + "\nAssistant:"
+    return "\n".join(prompt_parts) + "\nAssistant:"
+
+def hf_chat_completion(messages, temperature=0.7, max_new_tokens=500):
+    """
+    Simulate chat completion using text generation model
+    Converts chat messages into a prompt for text generation
+    
+    Args:
+        messages: List of message dicts with 'role' and 'content'
+        temperature: Sampling temperature
+        max_new_tokens: Maximum tokens to generate
     
-    return hf_generate(prompt, max_new_tokens=max_new_tokens, temperature=temperature)
+    Returns:
+        Generated response text
+    """
+    return hf_generate(chat_prompt(messages), max_new_tokens=max_new_tokens, temperature=temperature)
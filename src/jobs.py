@@ -0,0 +1,187 @@
+"""
+Background job runner
+
+Jobs are rows in the job table, so their state survives the request that
+created them and can be polled from any worker. Work runs on a bounded
+thread pool (JOB_MAX_WORKERS) so background jobs never put more than that
+many concurrent requests on the LLM provider.
+
+While a job is queued or running, the process that owns it refreshes
+its heartbeat_at every JOB_HEARTBEAT_SECONDS. A job whose heartbeat
+stops for JOB_STALE_SECONDS lost its worker (the process exited or was
+restarted) and is reported as failed; a long but healthy queue never is.
+
+Note: on Vercel the function is frozen once the response is sent, so
+background jobs only make progress on long-running servers.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+
+from src.models.job import Job
+from src.models.user import db
+
+JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 2))
+# Reject new jobs once this many are waiting or running in this process
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 100))
+# How often a process confirms the jobs it owns are still alive
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', 30))
+# Queued/running jobs without a heartbeat for this long are reported as failed
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 600))
+
+# Statuses a job can still leave; only these may be overwritten
+ACTIVE_STATUSES = ('queued', 'running')
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+# Ids of the jobs this process owns and keeps alive
+_active = set()
+_heartbeat = None
+
+
+class QueueFullError(Exception):
+    """Raised by submit_job when JOB_MAX_PENDING jobs are already pending"""
+
+
+def job_handler(kind):
+    """Register fn(payload) -> JSON-serializable result as the handler for kind"""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def _get_executor(app):
+    global _executor, _heartbeat
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _heartbeat = threading.Thread(target=_beat, args=(app,), name='job-heartbeat', daemon=True)
+                _heartbeat.start()
+                _executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix='job')
+    return _executor
+
+
+def _beat(app):
+    """Refresh heartbeat_at of this process's jobs until the process exits"""
+    job_table = Job.__table__
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _pending_lock:
+            job_ids = list(_active)
+        if not job_ids:
+            continue
+        try:
+            with app.app_context():
+                db.session.execute(
+                    update(job_table)
+                    .where(job_table.c.id.in_(job_ids), job_table.c.status.in_(ACTIVE_STATUSES))
+                    .values(heartbeat_at=datetime.utcnow(), updated_at=job_table.c.updated_at)
+                )
+                db.session.commit()
+        except Exception as e:
+            print(f"Warning: could not record job heartbeat: {e}")
+
+
+def _set_status(job_id, **values):
+    """
+    Update a job that is still queued or running, and commit
+
+    Returns:
+        False if the job had already finished or been expired, so nothing was written
+    """
+    job_table = Job.__table__
+    result = db.session.execute(
+        update(job_table)
+        .where(job_table.c.id == job_id, job_table.c.status.in_(ACTIVE_STATUSES))
+        .values(**values)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def submit_job(app, kind, payload):
+    """
+    Store a queued job and schedule it on the worker pool
+
+    Args:
+        app: Flask app whose context the worker runs in
+        kind: Name of a handler registered with @job_handler
+        payload: JSON-serializable dict passed to the handler
+
+    Returns:
+        The committed Job
+    """
+    global _pending
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    with _pending_lock:
+        if _pending >= JOB_MAX_PENDING:
+            raise QueueFullError('Too many pending jobs, try again later')
+        _pending += 1
+    job_id = None
+    try:
+        job = Job(kind=kind, payload=json.dumps(payload), worker=WORKER_ID, heartbeat_at=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+        with _pending_lock:
+            _active.add(job_id)
+        _get_executor(app).submit(_run_job, app, job_id)
+    except Exception:
+        with _pending_lock:
+            _pending -= 1
+            _active.discard(job_id)
+        raise
+    return job
+
+
+def _run_job(app, job_id):
+    global _pending
+    try:
+        with app.app_context():
+            if not _set_status(job_id, status='running', worker=WORKER_ID, heartbeat_at=datetime.utcnow()):
+                # Expired while it waited in the queue
+                return
+            job = db.session.get(Job, job_id)
+            try:
+                result = _handlers[job.kind](json.loads(job.payload))
+                outcome = {'status': 'succeeded', 'result': json.dumps(result)}
+            except Exception as e:
+                db.session.rollback()
+                outcome = {'status': 'failed', 'error': str(e)}
+            _set_status(job_id, **outcome)
+    except Exception as e:
+        print(f"Warning: job {job_id} could not be recorded: {e}")
+    finally:
+        with _pending_lock:
+            _pending -= 1
+            _active.discard(job_id)
+
+
+def get_job(job_id):
+    """Return the Job (or None), marking it failed if its worker stopped sending heartbeats"""
+    job = db.session.get(Job, job_id)
+    if job and job.status in ACTIVE_STATUSES:
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        if (job.heartbeat_at or job.updated_at) < cutoff:
+            job_table = Job.__table__
+            db.session.execute(
+                update(job_table)
+                .where(job_table.c.id == job_id, job_table.c.status.in_(ACTIVE_STATUSES))
+                .where(func.coalesce(job_table.c.heartbeat_at, job_table.c.updated_at) < cutoff)
+                .values(status='failed', error='Job was interrupted before it finished')
+            )
+            db.session.commit()
+            db.session.refresh(job)
+    return job
@@ -0,0 +1,71 @@
+"""
+JSON providers for the Flask app
+
+create_app() installs OrjsonProvider when orjson is installed and
+IsoJSONProvider (stdlib json) otherwise. Both write datetimes as ISO 8601,
+matching Note.to_dict(), so list endpoints can hand raw SQLAlchemy rows
+to jsonify without formatting every timestamp in Python first.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+import time
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+from src.metrics import observe_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+
+def _iso_default(obj):
+    """Serialize types json/orjson don't know; datetimes as ISO 8601"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    if hasattr(obj, '_asdict'):
+        return obj._asdict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """Flask's stdlib provider, but with ISO 8601 datetimes instead of HTTP dates"""
+    default = staticmethod(_iso_default)
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().response(*args, **kwargs)
+        observe_json(time.perf_counter() - start)
+        return response
+
+
+class OrjsonProvider(JSONProvider):
+    """orjson-backed provider; output matches IsoJSONProvider (sorted keys, ISO datetimes)"""
+    mimetype = 'application/json'
+    option = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_iso_default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_iso_default, option=self.option)
+        observe_json(time.perf_counter() - start)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def make_json_provider(app):
+    """Return the fastest available provider for app"""
+    if orjson is not None:
+        return OrjsonProvider(app)
+    return IsoJSONProvider(app)
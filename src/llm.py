@@ -1,97 +1,325 @@
 # import libraries
+import json
 import os
+import time
 from dotenv import load_dotenv
+from src.chunking import split_text
+from src.llm_cache import llm_cache, make_key
+from src.llm_guard import LLMUnavailableError, llm_guard
+from src.metrics import observe_llm
 
 load_dotenv()  # Loads environment variables from .env
 
 # Check for API keys - prioritize Hugging Face
 hf_api_key = os.getenv("HF_API_KEY")
 api_key = os.getenv("OPENAI_API_KEY") or os.getenv("GITHUB_TOKEN")
+using_github_models = bool(os.getenv("GITHUB_TOKEN") and not os.getenv("OPENAI_API_KEY"))
 
-# Determine which LLM provider to use
-use_huggingface = bool(hf_api_key)
 
-# Determine which model to use
-if use_huggingface:
-    # Using Hugging Face
-    default_model = os.getenv("HF_MODEL", "google/flan-t5-large")
-elif os.getenv("GITHUB_TOKEN") and not os.getenv("OPENAI_API_KEY"):
-    # Using GitHub Models
-    default_model = "gpt-4o-mini"
+class LLMProvider:
+    """
+    A chat completion backend selectable by name with LLM_PROVIDER
+
+    Subclasses set name, label and default_model and implement complete().
+    acomplete() defaults to running complete() in a worker thread.
+    """
+    name = None
+    # Used in error messages, e.g. "Hugging Face API call failed: ..."
+    label = "LLM"
+    default_model = None
+
+    def is_configured(self):
+        return True
+
+    def prepare(self, model, temperature, top_p):
+        """
+        Return the model and generation parameters for a request
+
+        The parameters are passed to complete() and are part of the cache key.
+        """
+        return model, {"temperature": temperature, "top_p": top_p}
+
+    def complete(self, model, messages, params):
+        raise NotImplementedError
+
+    async def acomplete(self, model, messages, params):
+        import asyncio
+        return await asyncio.to_thread(self.complete, model, messages, params)
+
+    def stream(self, model, messages, params):
+        """Yield the response in pieces; providers that can't stream yield it whole"""
+        yield self.complete(model, messages, params)
+
+
+class HuggingFaceProvider(LLMProvider):
+    name = "huggingface"
+    label = "Hugging Face"
+
+    def __init__(self):
+        self.default_model = os.getenv("HF_MODEL", "google/flan-t5-large")
+
+    def is_configured(self):
+        return bool(hf_api_key)
+
+    def prepare(self, model, temperature, top_p):
+        # Always HF_MODEL; convert temperature (0-2 range) to HF range (0-1)
+        return self.default_model, {"temperature": min(temperature / 2.0, 1.0), "max_new_tokens": 500}
+
+    def complete(self, model, messages, params):
+        from src.hf_helpers import hf_chat_completion
+        return hf_chat_completion(messages, **params)
+
+    async def acomplete(self, model, messages, params):
+        from src.llm_async import ahf_chat_completion, run_on_llm_loop
+        return await run_on_llm_loop(ahf_chat_completion(messages, **params))
+
+    def stream(self, model, messages, params):
+        from src.hf_helpers import chat_prompt, hf_generate_stream
+        return hf_generate_stream(chat_prompt(messages), **params)
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI, or GitHub Models through its OpenAI-compatible endpoint"""
+
+    def __init__(self, name="openai", default_model="gpt-3.5-turbo", api_base=None):
+        self.name = name
+        self.default_model = default_model
+        self.api_base = api_base
+
+    def is_configured(self):
+        return bool(api_key)
+
+    def _client(self):
+        # Try using openai library (v0.28.0 style)
+        import openai
+        openai.api_key = api_key
+        if self.api_base:
+            openai.api_base = self.api_base
+        return openai
+
+    def complete(self, model, messages, params):
+        openai = self._client()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = openai.ChatCompletion.create(model=model, messages=messages, **params)
+            status = "ok"
+        finally:
+            observe_llm(self.name, model, time.perf_counter() - start, status)
+        return response.choices[0].message.content
+
+    def stream(self, model, messages, params):
+        openai = self._client()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            for chunk in openai.ChatCompletion.create(model=model, messages=messages, stream=True, **params):
+                content = chunk.choices[0].delta.get("content") if chunk.choices else None
+                if content:
+                    yield content
+            status = "ok"
+        finally:
+            observe_llm(self.name, model, time.perf_counter() - start, status)
+
+    async def acomplete(self, model, messages, params):
+        from src.llm_async import _openai_chat, run_on_llm_loop
+        return await run_on_llm_loop(_openai_chat(model, messages, params["temperature"], params["top_p"]))
+
+
+def _local_provider():
+    from src.local_llm import LocalProvider
+    return LocalProvider()
+
+
+# Provider name -> zero-argument factory; add more with register_provider()
+_provider_factories = {
+    "huggingface": HuggingFaceProvider,
+    "openai": OpenAIProvider,
+    "github": lambda: OpenAIProvider("github", "gpt-4o-mini", "https://models.inference.ai.azure.com"),
+    "local": _local_provider,
+}
+_providers = {}
+
+
+def register_provider(name, factory):
+    """
+    Make a provider selectable with LLM_PROVIDER=name
+
+    Args:
+        name: Provider name, also used in cache keys and metrics
+        factory: Zero-argument callable returning an LLMProvider; called on first use
+    """
+    _provider_factories[name] = factory
+    _providers.pop(name, None)
+
+
+def get_provider(name=None):
+    """Return the named provider, or the active one, creating it on first use"""
+    name = name or provider
+    if name not in _providers:
+        if name not in _provider_factories:
+            raise ValueError(f"Unknown LLM provider: {name} (choose from {', '.join(sorted(_provider_factories))})")
+        _providers[name] = _provider_factories[name]()
+    return _providers[name]
+
+
+def set_provider(name):
+    """Switch the active provider, e.g. to "local" in a benchmark"""
+    global provider, use_huggingface, default_model
+    default_model = get_provider(name).default_model
+    provider = name
+    use_huggingface = name == "huggingface"
+
+
+# Name of the active provider, used in cache keys. LLM_PROVIDER picks one
+# explicitly; otherwise prefer Hugging Face, then GitHub Models, then OpenAI
+if os.getenv("LLM_PROVIDER"):
+    provider = os.getenv("LLM_PROVIDER").lower()
+elif hf_api_key:
+    provider = "huggingface"
+elif using_github_models:
+    provider = "github"
 else:
-    # Using OpenAI API
-    default_model = "gpt-3.5-turbo"
+    provider = "openai"
+set_provider(provider)
 
 # A function to call an LLM model and return the response
+# Identical requests are answered from llm_cache (see src/llm_cache.py)
 def call_llm_model(model, messages, temperature=1.0, top_p=1.0):
-    # Use Hugging Face if available
-    if use_huggingface:
-        try:
-            from src.hf_helpers import hf_chat_completion
-            # Convert temperature (0-2 range) to HF range (0-1)
-            hf_temperature = min(temperature / 2.0, 1.0)
-            return hf_chat_completion(messages, temperature=hf_temperature, max_new_tokens=500)
-        except Exception as e:
-            raise Exception(f"Hugging Face API call failed: {str(e)}")
-    
-    # Fallback to OpenAI/GitHub Models
-    if not api_key:
-        raise ValueError("Either HF_API_KEY, OPENAI_API_KEY, or GITHUB_TOKEN environment variable must be set")
-    
+    backend = get_provider()
+    if not backend.is_configured():
+        raise ValueError("Either HF_API_KEY, OPENAI_API_KEY, or GITHUB_TOKEN environment variable must be set (or LLM_PROVIDER=local)")
+
+    model, params = backend.prepare(model, temperature, top_p)
     try:
-        # Try using openai library (v0.28.0 style)
-        import openai
-        openai.api_key = api_key
-        
-        # If using GitHub token, use GitHub Models endpoint
-        if os.getenv("GITHUB_TOKEN") and not os.getenv("OPENAI_API_KEY"):
-            openai.api_base = "https://models.inference.ai.azure.com"
-        
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            top_p=top_p
+        return llm_cache.get_or_call(
+            backend.name, model, messages, params,
+            lambda: backend.complete(model, messages, params)
         )
-        return response.choices[0].message.content
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        raise Exception(f"LLM API call failed: {str(e)}")
+        raise Exception(f"{backend.label} API call failed: {str(e)}")
+
+def _cached_stream(provider_name, model, prompt, params, stream_fn, error_prefix):
+    """Yield a cached response whole, or stream it from stream_fn() and cache it once complete"""
+    key = make_key(provider_name, model, prompt, params)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    pieces = []
+    try:
+        # Streams aren't coalesced, but hold a concurrency slot and count towards the breaker
+        with llm_guard.slot(provider_name, model):
+            for piece in stream_fn():
+                pieces.append(piece)
+                yield piece
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        raise Exception(f"{error_prefix}: {str(e)}")
+    llm_cache.set(key, "".join(pieces))
+
+# Like call_llm_model, but yields the response in pieces as the provider produces them
+def stream_llm_model(model, messages, temperature=1.0, top_p=1.0):
+    backend = get_provider()
+    if not backend.is_configured():
+        raise ValueError("Either HF_API_KEY, OPENAI_API_KEY, or GITHUB_TOKEN environment variable must be set (or LLM_PROVIDER=local)")
+
+    model, params = backend.prepare(model, temperature, top_p)
+    yield from _cached_stream(
+        backend.name, model, messages, params,
+        lambda: backend.stream(model, messages, params), f"{backend.label} API call failed"
+    )
+
+# Prompts used to translate with a generation model
+hf_translation_prompt = "Translate the following text to {target_language}. Return ONLY the translated text, no explanations:\n\n{text}"
+translation_prompt = "Translate the following text to {target_language}. Return ONLY the translated text, no explanations or additional text:\n\n{text}"
+
+# Map common language names to codes
+lang_map = {
+    "spanish": "es", "french": "fr", "german": "de", "italian": "it",
+    "portuguese": "pt", "chinese": "zh", "japanese": "ja", "korean": "ko",
+    "russian": "ru", "arabic": "ar", "hindi": "hi", "english": "en"
+}
+
+def language_code(target_language):
+    return lang_map.get(target_language.lower(), target_language.lower()[:2])
 
 # A function to translate text using the LLM model
+# Long texts are translated in chunks, several at once (see src/chunking.py)
 def translate(text, target_language):
+    if len(split_text(text)) > 1:
+        from src.llm_async import atranslate, run_blocking
+        return run_blocking(atranslate(text, target_language))
+
     # Use Hugging Face translation if available
     if use_huggingface:
         try:
             from src.hf_helpers import hf_translate, hf_generate
             
-            # Map common language names to codes
-            lang_map = {
-                "spanish": "es", "french": "fr", "german": "de", "italian": "it",
-                "portuguese": "pt", "chinese": "zh", "japanese": "ja", "korean": "ko",
-                "russian": "ru", "arabic": "ar", "hindi": "hi", "english": "en"
-            }
-            target_code = lang_map.get(target_language.lower(), target_language.lower()[:2])
+            target_code = language_code(target_language)
             
             # Try translation model first
             translation_model = os.getenv("HF_TRANSLATION_MODEL", "")
             if translation_model:
                 try:
-                    return hf_translate(text, source_lang="auto", target_lang=target_code)
+                    return llm_cache.get_or_call(
+                        provider, translation_model, text, {"target_lang": target_code},
+                        lambda: hf_translate(text, source_lang="auto", target_lang=target_code)
+                    )
                 except Exception as e:
                     print(f"Translation model failed, falling back to generation: {e}")
             
             # Fallback: use generation model for translation
-            prompt = f"Translate the following text to {target_language}. Return ONLY the translated text, no explanations:\n\n{text}"
-            return hf_generate(prompt, max_new_tokens=300, temperature=0.3)
+            prompt = hf_translation_prompt.format(target_language=target_language, text=text)
+            return llm_cache.get_or_call(
+                provider, os.getenv("HF_MODEL", "google/flan-t5-large"), prompt,
+                {"max_new_tokens": 300, "temperature": 0.3},
+                lambda: hf_generate(prompt, max_new_tokens=300, temperature=0.3)
+            )
             
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             raise Exception(f"Hugging Face translation failed: {str(e)}")
     
     # Fallback to OpenAI/GitHub Models
-    prompt = f"Translate the following text to {target_language}. Return ONLY the translated text, no explanations or additional text:\n\n{text}"
+    prompt = translation_prompt.format(target_language=target_language, text=text)
     messages = [{"role": "user", "content": prompt}]
     return call_llm_model(default_model, messages)
 
+# Like translate, but yields the translation in pieces
+def stream_translate(text, target_language):
+    chunks = split_text(text)
+    if len(chunks) > 1:
+        # Chunks are translated in parallel and each is sent once it and
+        # every chunk before it are done
+        from src.llm_async import atranslate, iter_chunks
+        results = iter_chunks(chunks, lambda chunk: atranslate(chunk, target_language))
+        for (_, separator), translated in zip(chunks, results):
+            yield translated.strip() + separator
+        return
+
+    if use_huggingface:
+        if os.getenv("HF_TRANSLATION_MODEL", ""):
+            # Translation models answer in one piece
+            yield translate(text, target_language)
+            return
+        from src.hf_helpers import hf_generate_stream
+        prompt = hf_translation_prompt.format(target_language=target_language, text=text)
+        yield from _cached_stream(
+            provider, os.getenv("HF_MODEL", "google/flan-t5-large"), prompt,
+            {"max_new_tokens": 300, "temperature": 0.3},
+            lambda: hf_generate_stream(prompt, max_new_tokens=300, temperature=0.3),
+            "Hugging Face translation failed"
+        )
+        return
+
+    prompt = translation_prompt.format(target_language=target_language, text=text)
+    yield from stream_llm_model(default_model, [{"role": "user", "content": prompt}])
+
 system_prompt = '''
 Extract the user's notes into the following structured fields:
 1. Title: A concise title of the notes less than 5 words
@@ -100,7 +328,7 @@ Extract the user's notes into the following structured fields:
 4. Event Date: Extract any date mentioned in the input. If no date is mentioned, use an empty string "".
 5. Event Time: Extract any time mentioned in the input. If no time is mentioned, use an empty string "".
 
-Today's date and time {Current_DateTime}.
+Today's date is {Current_DateTime}.
 
 When extracting dates and times:
 - Convert relative dates like "yesterday", "today", "tomorrow", "next week" to actual dates
@@ -146,14 +374,108 @@ Output:
 }}
 '''
 
-# A function to extract structured notes using the LLM model
-def extract_structured_notes(text, lang="English"):
+def extraction_messages(text, lang="English"):
     from datetime import datetime
-    current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Date only (no clock time) so the prompt, and its cache key, stay stable all day
+    current_datetime = datetime.now().strftime("%Y-%m-%d (%A)")
     prompt = system_prompt.format(lang=lang, Current_DateTime=current_datetime) + f"\nInput: \"{text}\""
-    messages = [{"role": "user", "content": prompt}]
-    response = call_llm_model(default_model, messages)
-    return response
+    return [{"role": "user", "content": prompt}]
+
+# Shorter prompt used when the rules in src/quick_extract.py already found
+# the event date and time, so the model needs no date rules or examples
+compact_system_prompt = '''
+Extract the user's notes as JSON with these keys:
+"Title": a concise title of less than 5 words
+"Notes": the notes written in full sentences
+"Tags": a list of at most 3 keywords
+"Event Date": {event_date}
+"Event Time": {event_time}
+
+Use the Event Date and Event Time exactly as given.{tag_hint} Output in JSON format without ```json. Output title and notes in the language: {lang}.
+'''
+
+def compact_extraction_messages(text, lang, quick):
+    tag_hint = f" Suggested tags: {', '.join(quick.tags)}." if quick.tags else ""
+    prompt = compact_system_prompt.format(
+        event_date=json.dumps(quick.event_date), event_time=json.dumps(quick.event_time),
+        tag_hint=tag_hint, lang=lang
+    ) + f"\nInput: \"{text}\""
+    return [{"role": "user", "content": prompt}]
+
+class ExtractionPlan:
+    """
+    How one structured-notes request is answered
+
+    The rules in src/quick_extract.py run first. A short English input they
+    fully resolve is answered locally (local_response is set and messages is
+    None). A long input is split into chunks, each extracted with a plan of
+    its own, and neither is set. Otherwise messages holds the prompt: the
+    compact one when the rules found the date and time unambiguously, else
+    the full one. Dates and times the rules found take precedence over the
+    model's.
+    """
+
+    def __init__(self, text, lang="English"):
+        from src.quick_extract import QUICK_EXTRACT_ENABLED, quick_extract
+        self.text = text
+        self.lang = lang
+        self.quick = quick_extract(text) if QUICK_EXTRACT_ENABLED else None
+        self.chunks = split_text(text)
+        self.local_response = None
+        self.messages = None
+        if len(self.chunks) > 1:
+            # Each chunk gets a plan of its own
+            return
+        quick = self.quick
+        if quick is not None and quick.complete and lang.lower() in ("english", "en"):
+            self.local_response = json.dumps(quick.as_structured(), ensure_ascii=False)
+        elif quick is not None and quick.has_when and not quick.unresolved:
+            self.messages = compact_extraction_messages(text, lang, quick)
+        else:
+            self.messages = extraction_messages(text, lang)
+
+    def field(self, name, value):
+        """Return the value to use for one field of the model's response"""
+        if self.quick is not None and not self.quick.unresolved:
+            if name == "Event Date" and self.quick.event_date:
+                return self.quick.event_date
+            if name == "Event Time" and self.quick.event_time:
+                return self.quick.event_time
+        return value
+
+    def finish(self, response):
+        """Apply field() to a model response; responses that aren't a JSON object are returned as-is"""
+        try:
+            data = json.loads(response)
+        except (TypeError, ValueError):
+            return response
+        if not isinstance(data, dict):
+            return response
+        return json.dumps({name: self.field(name, value) for name, value in data.items()}, ensure_ascii=False)
+
+# A function to extract structured notes using the LLM model
+def extract_structured_notes(text, lang="English"):
+    plan = ExtractionPlan(text, lang)
+    if len(plan.chunks) > 1:
+        from src.llm_async import aextract_structured_notes, run_blocking
+        return run_blocking(aextract_structured_notes(text, lang))
+    if plan.local_response is not None:
+        return plan.local_response
+    response = call_llm_model(default_model, plan.messages)
+    return plan.finish(response)
+
+# Like extract_structured_notes, but yields the raw response in pieces; pass
+# the joined response through plan.finish()
+def stream_structured_notes(plan):
+    if len(plan.chunks) > 1:
+        # The merged result is only known once every chunk is done
+        from src.llm_async import aextract_structured_notes, run_blocking
+        yield run_blocking(aextract_structured_notes(plan.text, plan.lang))
+        return
+    if plan.local_response is not None:
+        yield plan.local_response
+        return
+    yield from stream_llm_model(default_model, plan.messages)
 
 # Main function
 def main():
@@ -0,0 +1,487 @@
+"""
+Non-blocking LLM client
+
+Provider I/O runs on one background asyncio event loop that owns a pooled
+aiohttp session. Async views await it through run_on_llm_loop(), so a
+request waiting on a slow model load holds no worker CPU and no extra
+socket, and every in-flight LLM request shares the same loop and
+connection pool. Prompts, caching and response parsing are shared with
+src/llm.py and src/hf_helpers.py.
+"""
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+
+import aiohttp
+
+from src import chunking, hf_helpers, llm
+from src.llm_cache import llm_cache, make_key
+from src.llm_guard import LLMUnavailableError, llm_guard
+from src.metrics import observe_llm
+
+# Statuses worth retrying, as in the requests adapter used by hf_call_model
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Inputs sent in one Hugging Face request by the batch functions
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", 8))
+# Provider requests a single batch call keeps in flight at once
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", 4))
+# Chunks of one long note in flight at once (see src/chunking.py)
+LLM_CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", 4))
+
+_loop = None
+_loop_lock = threading.Lock()
+_hf_session = None
+_openai_session = None
+
+
+def get_llm_loop():
+    """Return the shared LLM event loop, starting its thread on first use"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+async def run_on_llm_loop(coro):
+    """Run coro on the shared LLM loop and await its result from any loop"""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, get_llm_loop()))
+
+
+def run_blocking(coro, timeout=None):
+    """Run coro on the shared LLM loop from synchronous code and wait for it"""
+    return asyncio.run_coroutine_threadsafe(coro, get_llm_loop()).result(timeout)
+
+
+@atexit.register
+def _close_sessions():
+    """Close pooled sessions so interpreter shutdown doesn't warn about them"""
+    if _loop is None:
+        return
+
+    async def close():
+        for session in (_hf_session, _openai_session):
+            if session is not None and not session.closed:
+                await session.close()
+
+    try:
+        run_blocking(close(), timeout=5)
+    except Exception:
+        pass
+
+
+def _trace_config():
+    """Accumulate connection setup time into the request's timing dict"""
+    trace = aiohttp.TraceConfig()
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.trace_request_ctx["connect_start"] = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        timing = ctx.trace_request_ctx
+        timing["connect"] += time.perf_counter() - timing.pop("connect_start")
+
+    trace.on_connection_create_start.append(on_connection_create_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    return trace
+
+
+async def _get_hf_session():
+    global _hf_session
+    if _hf_session is None or _hf_session.closed:
+        _hf_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=hf_helpers.HF_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=hf_helpers.HF_CONNECT_TIMEOUT,
+                sock_read=hf_helpers.HF_READ_TIMEOUT,
+            ),
+            trace_configs=[_trace_config()],
+        )
+    return _hf_session
+
+
+def _retry_delay(attempt, headers=None, body=None):
+    """Seconds to wait before the next attempt, capped at HF_BACKOFF_MAX"""
+    delay = hf_helpers.HF_BACKOFF_FACTOR * (2 ** attempt)
+    if headers and headers.get("Retry-After", "").isdigit():
+        delay = float(headers["Retry-After"])
+    elif body:
+        try:
+            # 503 while loading carries the model's estimated load time
+            delay = float(json.loads(body).get("estimated_time", delay))
+        except (ValueError, AttributeError):
+            pass
+    return min(delay, hf_helpers.HF_BACKOFF_MAX)
+
+
+async def ahf_call_model(model, payload, retry_count=3):
+    """
+    Async version of hf_call_model; must run on the LLM loop
+
+    Args:
+        model: Model name in format "owner/model"
+        payload: Dictionary with model-specific parameters
+        retry_count: Number of attempts if the model is loading or the call fails
+
+    Returns:
+        API response as dict or string
+    """
+    if not hf_helpers.HF_API_KEY:
+        raise ValueError("HF_API_KEY environment variable must be set")
+
+    headers = {"Authorization": f"Bearer {hf_helpers.HF_API_KEY}"}
+    api_url = f"{hf_helpers.HF_API_URL}{model}"
+    session = await _get_hf_session()
+
+    timing = {"connect": 0.0}
+    start = time.perf_counter()
+    status = None
+    ttfb = 0.0
+    try:
+        for attempt in range(retry_count):
+            last_attempt = attempt == retry_count - 1
+            try:
+                async with session.post(api_url, headers=headers, json=payload, trace_request_ctx=timing) as response:
+                    ttfb = time.perf_counter() - start
+                    status = response.status
+                    body = await response.read()
+                    if status in RETRY_STATUSES and not last_attempt:
+                        await asyncio.sleep(_retry_delay(attempt, response.headers, body))
+                        continue
+                    if status >= 400:
+                        raise Exception(f"Hugging Face API error: {status} {response.reason} for url: {api_url} - Status: {status}")
+                    return json.loads(body) if body else None
+            except asyncio.TimeoutError:
+                if not last_attempt:
+                    await asyncio.sleep(_retry_delay(attempt))
+                    continue
+                raise Exception(f"Request timed out after {retry_count} attempts")
+            except aiohttp.ClientError as e:
+                if not last_attempt:
+                    await asyncio.sleep(_retry_delay(attempt))
+                    continue
+                raise Exception(f"Hugging Face API error: {str(e)} - Status: {status if status is not None else 'N/A'}")
+    finally:
+        hf_helpers.record_timing(model, status, timing["connect"], ttfb, time.perf_counter() - start)
+
+
+async def ahf_generate(prompt, max_new_tokens=200, temperature=0.7):
+    model, payload = hf_helpers.generation_request(prompt, max_new_tokens, temperature)
+    return hf_helpers.parse_generation(await ahf_call_model(model, payload))
+
+
+async def ahf_translate(text, source_lang="en", target_lang="es"):
+    model, payload = hf_helpers.translation_request(text, target_lang)
+    return hf_helpers.parse_translation(await ahf_call_model(model, payload))
+
+
+async def ahf_generate_batch(prompts, max_new_tokens=200, temperature=0.7):
+    """Generate for several prompts in one request ("inputs" as a list)"""
+    model, payload = hf_helpers.generation_request(list(prompts), max_new_tokens, temperature)
+    return hf_helpers.parse_batch(await ahf_call_model(model, payload), len(prompts), hf_helpers.parse_generation)
+
+
+async def ahf_translate_batch(texts, target_lang="es"):
+    """Translate several texts in one request ("inputs" as a list)"""
+    calls = [hf_helpers.translation_request(text, target_lang) for text in texts]
+    model = calls[0][0]
+    payload = {"inputs": [payload["inputs"] for _, payload in calls]}
+    return hf_helpers.parse_batch(await ahf_call_model(model, payload), len(texts), hf_helpers.parse_translation)
+
+
+async def ahf_chat_completion(messages, temperature=0.7, max_new_tokens=500):
+    return await ahf_generate(hf_helpers.chat_prompt(messages), max_new_tokens=max_new_tokens, temperature=temperature)
+
+
+async def _openai_chat(model, messages, temperature, top_p):
+    """OpenAI/GitHub Models chat completion; must run on the LLM loop"""
+    global _openai_session
+    import openai
+    openai.api_key = llm.api_key
+    if os.getenv("GITHUB_TOKEN") and not os.getenv("OPENAI_API_KEY"):
+        openai.api_base = "https://models.inference.ai.azure.com"
+    if _openai_session is None or _openai_session.closed:
+        _openai_session = aiohttp.ClientSession()
+    # openai 0.28 opens a new aiohttp session per call unless one is provided
+    openai.aiosession.set(_openai_session)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p
+        )
+        status = "ok"
+    finally:
+        observe_llm(llm.provider, model, time.perf_counter() - start, status)
+    return response.choices[0].message.content
+
+
+async def acall_llm_model(model, messages, temperature=1.0, top_p=1.0):
+    """Async version of llm.call_llm_model"""
+    backend = llm.get_provider()
+    if not backend.is_configured():
+        raise ValueError("Either HF_API_KEY, OPENAI_API_KEY, or GITHUB_TOKEN environment variable must be set (or LLM_PROVIDER=local)")
+
+    model, params = backend.prepare(model, temperature, top_p)
+    try:
+        return await llm_cache.aget_or_call(
+            backend.name, model, messages, params,
+            lambda: backend.acomplete(model, messages, params)
+        )
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        raise Exception(f"{backend.label} API call failed: {str(e)}")
+
+
+async def atranslate(text, target_language):
+    """Async version of llm.translate"""
+    chunks = chunking.split_text(text)
+    if len(chunks) > 1:
+        outputs = await _map_chunks(chunks, lambda chunk: atranslate(chunk, target_language))
+        return chunking.join_chunks(outputs, chunks)
+
+    if llm.use_huggingface:
+        try:
+            target_code = llm.language_code(target_language)
+
+            translation_model = os.getenv("HF_TRANSLATION_MODEL", "")
+            if translation_model:
+                try:
+                    return await llm_cache.aget_or_call(
+                        llm.provider, translation_model, text, {"target_lang": target_code},
+                        lambda: run_on_llm_loop(ahf_translate(text, source_lang="auto", target_lang=target_code))
+                    )
+                except Exception as e:
+                    print(f"Translation model failed, falling back to generation: {e}")
+
+            prompt = llm.hf_translation_prompt.format(target_language=target_language, text=text)
+            return await llm_cache.aget_or_call(
+                llm.provider, os.getenv("HF_MODEL", "google/flan-t5-large"), prompt,
+                {"max_new_tokens": 300, "temperature": 0.3},
+                lambda: run_on_llm_loop(ahf_generate(prompt, max_new_tokens=300, temperature=0.3))
+            )
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            raise Exception(f"Hugging Face translation failed: {str(e)}")
+
+    prompt = llm.translation_prompt.format(target_language=target_language, text=text)
+    messages = [{"role": "user", "content": prompt}]
+    return await acall_llm_model(llm.default_model, messages)
+
+
+async def aextract_structured_notes(text, lang="English"):
+    """Async version of llm.extract_structured_notes"""
+    plan = llm.ExtractionPlan(text, lang)
+    if len(plan.chunks) > 1:
+        outputs = await _map_chunks(plan.chunks, lambda chunk: aextract_structured_notes(chunk, lang))
+        return plan.finish(chunking.merge_extractions(outputs))
+    if plan.local_response is not None:
+        return plan.local_response
+    return plan.finish(await acall_llm_model(llm.default_model, plan.messages))
+
+
+async def gather_bounded(coro_fns, limit=LLM_BATCH_CONCURRENCY):
+    """
+    Run zero-argument coroutine functions with at most limit in flight
+
+    Returns:
+        Results in input order; a failed call yields its exception instead
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(fn):
+        async with semaphore:
+            try:
+                return await fn()
+            except Exception as e:
+                return e
+
+    return await asyncio.gather(*(run(fn) for fn in coro_fns))
+
+
+async def _map_chunks(chunks, fn):
+    """
+    Call fn(chunk) for every chunk of one note, LLM_CHUNK_CONCURRENCY at a time
+
+    Returns:
+        Results in chunk order; raises the first failure, as the note as a
+        whole can't be answered without it
+    """
+    outputs = await gather_bounded([lambda chunk=chunk: fn(chunk) for chunk, _ in chunks], LLM_CHUNK_CONCURRENCY)
+    for output in outputs:
+        if isinstance(output, Exception):
+            raise output
+    return outputs
+
+
+def iter_chunks(chunks, fn):
+    """
+    Synchronous generator over fn(chunk) for every chunk, in order
+
+    The calls run on the shared LLM loop, LLM_CHUNK_CONCURRENCY at a time,
+    so later chunks are worked on while earlier results are being used.
+    Closing the generator cancels the calls not yet finished.
+    """
+    semaphore = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
+
+    async def run(chunk):
+        async with semaphore:
+            return await fn(chunk)
+
+    futures = [asyncio.run_coroutine_threadsafe(run(chunk), get_llm_loop()) for chunk, _ in chunks]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+async def _split_long(texts, fn, short_fn):
+    """
+    Answer texts that need chunking with fn(text) and the rest with one short_fn(list_of_texts)
+
+    Returns:
+        Results in input order, as short_fn and gather_bounded return them
+    """
+    chunked = [i for i, text in enumerate(texts) if len(chunking.split_text(text)) > 1]
+    if not chunked:
+        return await short_fn(texts)
+    short = sorted(set(range(len(texts))) - set(chunked))
+    results = [None] * len(texts)
+
+    async def run_short():
+        return await short_fn([texts[i] for i in short]) if short else []
+
+    short_results, chunked_results = await asyncio.gather(
+        run_short(), gather_bounded([lambda i=i: fn(texts[i]) for i in chunked])
+    )
+    for indices, outputs in ((short, short_results), (chunked, chunked_results)):
+        for i, output in zip(indices, outputs):
+            results[i] = output
+    return results
+
+
+async def _cached_batch(model, params, cache_prompts, inputs, batch_call, single_call):
+    """
+    Answer many Hugging Face requests with as few provider calls as possible
+
+    Cached results are used as-is. Misses are sent LLM_BATCH_SIZE at a time
+    through batch_call(list_of_inputs); the items of chunks that failed are
+    then retried one by one with single_call(index), so one bad input
+    doesn't sink the rest.
+
+    Returns:
+        List of strings or exceptions in input order
+    """
+    keys = [make_key(llm.provider, model, prompt, params) for prompt in cache_prompts]
+    results = [llm_cache.get(key) for key in keys]
+    misses = [i for i, result in enumerate(results) if result is None]
+    chunks = [misses[start:start + LLM_BATCH_SIZE] for start in range(0, len(misses), LLM_BATCH_SIZE)]
+
+    failed = []
+
+    def store(indices, outputs):
+        for i, output in zip(indices, outputs):
+            results[i] = output
+            if isinstance(output, str):
+                llm_cache.set(keys[i], output)
+
+    async def run_chunk(chunk):
+        try:
+            outputs = await llm_guard.acall(
+                llm.provider, model, None, lambda: run_on_llm_loop(batch_call([inputs[i] for i in chunk]))
+            )
+        except Exception as e:
+            print(f"Batch request failed, retrying items one by one: {e}")
+            failed.extend(chunk)
+            return
+        store(chunk, outputs)
+
+    await gather_bounded([lambda chunk=chunk: run_chunk(chunk) for chunk in chunks])
+    # Retried only once every chunk is done, so no more than LLM_BATCH_CONCURRENCY
+    # requests are ever in flight
+    if failed:
+        failed.sort()
+        store(failed, await gather_bounded([lambda i=i: single_call(i) for i in failed]))
+    return results
+
+
+async def _ahf_translate_batch(texts, target_language):
+    target_code = llm.language_code(target_language)
+    translation_model = os.getenv("HF_TRANSLATION_MODEL", "")
+    if translation_model:
+        return await _cached_batch(
+            translation_model, {"target_lang": target_code}, texts, texts,
+            lambda chunk: ahf_translate_batch(chunk, target_code),
+            lambda i: atranslate(texts[i], target_language)
+        )
+    prompts = [llm.hf_translation_prompt.format(target_language=target_language, text=text) for text in texts]
+    return await _cached_batch(
+        os.getenv("HF_MODEL", "google/flan-t5-large"), {"max_new_tokens": 300, "temperature": 0.3},
+        prompts, prompts,
+        lambda chunk: ahf_generate_batch(chunk, max_new_tokens=300, temperature=0.3),
+        lambda i: atranslate(texts[i], target_language)
+    )
+
+
+async def atranslate_batch(texts, target_language):
+    """
+    Translate many texts, batching Hugging Face requests where possible
+
+    Returns:
+        List of translated strings or exceptions, in input order
+    """
+    if llm.use_huggingface:
+        # Long texts are translated chunk by chunk; the rest share batched requests
+        return await _split_long(
+            texts, lambda text: atranslate(text, target_language),
+            lambda short: _ahf_translate_batch(short, target_language)
+        )
+    # Chat completion APIs take one conversation per request: fan out instead
+    return await gather_bounded([lambda text=text: atranslate(text, target_language) for text in texts])
+
+
+async def _ahf_extract_batch(texts, lang):
+    plans = [llm.ExtractionPlan(text, lang) for text in texts]
+    results = [plan.local_response for plan in plans]
+    # Only what the rules couldn't answer goes to the model
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        # Same parameters as acall_llm_model's default temperature of 1.0
+        messages = [plans[i].messages for i in pending]
+        outputs = await _cached_batch(
+            os.getenv("HF_MODEL", "google/flan-t5-large"), {"temperature": 0.5, "max_new_tokens": 500},
+            messages, [hf_helpers.chat_prompt(m) for m in messages],
+            lambda chunk: ahf_generate_batch(chunk, max_new_tokens=500, temperature=0.5),
+            lambda j: aextract_structured_notes(texts[pending[j]], lang)
+        )
+        for i, output in zip(pending, outputs):
+            results[i] = plans[i].finish(output) if isinstance(output, str) else output
+    return results
+
+
+async def aextract_structured_notes_batch(texts, lang="English"):
+    """
+    Extract structured notes for many texts, batching Hugging Face requests
+
+    Returns:
+        List of raw model responses or exceptions, in input order
+    """
+    if llm.use_huggingface:
+        return await _split_long(
+            texts, lambda text: aextract_structured_notes(text, lang),
+            lambda short: _ahf_extract_batch(short, lang)
+        )
+    return await gather_bounded([lambda text=text: aextract_structured_notes(text, lang) for text in texts])
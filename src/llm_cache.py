@@ -0,0 +1,255 @@
+"""
+Content-addressed cache for LLM responses
+
+Entries are keyed on a hash of (provider, model, prompt, parameters).
+Lookups go to an in-process LRU first and then, if LLM_CACHE_URL is set,
+to a persistent table. Both tiers expire entries after LLM_CACHE_TTL
+seconds and are bounded in size.
+
+Environment variables:
+    LLM_CACHE_ENABLED: "0" turns caching off (default "1")
+    LLM_CACHE_TTL: Seconds an entry stays valid (default 7 days)
+    LLM_CACHE_MAX_ENTRIES: In-process LRU size (default 1024)
+    LLM_CACHE_URL: "app" to use the app database, or a SQLAlchemy URL such
+        as "sqlite:///llm_cache.db" for a local file (default: memory only)
+    LLM_CACHE_PERSIST_MAX_ENTRIES: Rows kept in the persistent tier (default 10000)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, create_engine, delete, select
+
+from src.llm_guard import llm_guard
+
+_metadata = MetaData()
+
+llm_cache_table = Table(
+    'llm_cache', _metadata,
+    Column('key', String(64), primary_key=True),
+    Column('value', Text, nullable=False),
+    Column('created_at', Float, nullable=False, index=True),
+)
+
+
+def make_key(provider, model, prompt, params=None):
+    """Return a stable sha256 hex key for an LLM request"""
+    payload = json.dumps(
+        {'provider': provider, 'model': model, 'prompt': prompt, 'params': params or {}},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Two-tier (memory LRU + optional database) response cache"""
+
+    # Trim the persistent tier after this many writes rather than on every write
+    PRUNE_EVERY = 100
+
+    def __init__(self, ttl=7 * 24 * 3600, max_entries=1024, url=None, persist_max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.url = url
+        self.persist_max_entries = persist_max_entries
+        self._entries = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._engine = None
+        self._table_ready = set()
+        self._writes = 0
+        self.stats = {
+            'memory_hits': 0, 'persistent_hits': 0, 'misses': 0,
+            'stores': 0, 'evictions': 0, 'errors': 0,
+        }
+
+    # Persistent tier
+
+    def _get_engine(self):
+        """Return the engine for the persistent tier, or None if disabled"""
+        if not self.url:
+            return None
+        if self.url == 'app':
+            try:
+                from src.models.user import db
+                engine = db.engine
+            except RuntimeError:
+                # Outside an app context there is no app database to use
+                return None
+        else:
+            if self._engine is None:
+                self._engine = create_engine(self.url)
+            engine = self._engine
+        if str(engine.url) not in self._table_ready:
+            _metadata.create_all(engine)
+            self._table_ready.add(str(engine.url))
+        return engine
+
+    def _persistent_get(self, key, now):
+        engine = self._get_engine()
+        if engine is None:
+            return None
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(llm_cache_table.c.value, llm_cache_table.c.created_at)
+                .where(llm_cache_table.c.key == key)
+            ).first()
+        if row is None or now - row.created_at > self.ttl:
+            return None
+        return row.created_at, row.value
+
+    def _persistent_set(self, key, value, now):
+        engine = self._get_engine()
+        if engine is None:
+            return
+        with engine.begin() as conn:
+            conn.execute(delete(llm_cache_table).where(llm_cache_table.c.key == key))
+            conn.execute(llm_cache_table.insert().values(key=key, value=value, created_at=now))
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(conn, now)
+
+    def _prune(self, conn, now):
+        """Drop expired rows and the oldest rows beyond persist_max_entries"""
+        conn.execute(delete(llm_cache_table).where(llm_cache_table.c.created_at < now - self.ttl))
+        cutoff = conn.execute(
+            select(llm_cache_table.c.created_at)
+            .order_by(llm_cache_table.c.created_at.desc())
+            .offset(self.persist_max_entries).limit(1)
+        ).scalar()
+        if cutoff is not None:
+            conn.execute(delete(llm_cache_table).where(llm_cache_table.c.created_at <= cutoff))
+
+    # Memory tier
+
+    def _remember(self, key, created_at, value):
+        with self._lock:
+            self._entries[key] = (created_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    # Public API
+
+    def get(self, key):
+        """Return the cached string for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+        try:
+            entry = self._persistent_get(key, now)
+        except Exception as e:
+            print(f"Warning: LLM cache read failed: {e}")
+            self.stats['errors'] += 1
+            entry = None
+        if entry is not None:
+            self._remember(key, *entry)
+            self.stats['persistent_hits'] += 1
+            return entry[1]
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        """Store a string response under key in both tiers"""
+        now = time.time()
+        self._remember(key, now, value)
+        self.stats['stores'] += 1
+        try:
+            self._persistent_set(key, value, now)
+        except Exception as e:
+            print(f"Warning: LLM cache write failed: {e}")
+            self.stats['errors'] += 1
+
+    def get_or_call(self, provider, model, prompt, params, fn):
+        """
+        Return a cached response, or call fn() and cache its result
+
+        Args:
+            provider: Provider name, e.g. "huggingface" or "openai"
+            model: Model name
+            prompt: Prompt string or list of chat messages
+            params: Dict of generation parameters that affect the output
+            fn: Zero-argument callable that performs the real request
+
+        Returns:
+            Response string
+        """
+        key = make_key(provider, model, prompt, params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        # Identical misses in flight at once share one provider call (see src/llm_guard.py)
+        return llm_guard.call(provider, model, key, lambda: self._store(key, fn()))
+
+    async def aget_or_call(self, provider, model, prompt, params, coro_fn):
+        """Async variant of get_or_call; coro_fn() returns an awaitable"""
+        key = make_key(provider, model, prompt, params)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        async def call():
+            return self._store(key, await coro_fn())
+
+        return await llm_guard.acall(provider, model, key, call)
+
+    def _store(self, key, value):
+        if isinstance(value, str):
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        """Return counters plus the current memory tier size and hit rate"""
+        stats = dict(self.stats)
+        hits = stats['memory_hits'] + stats['persistent_hits']
+        lookups = hits + stats['misses']
+        stats['entries'] = len(self._entries)
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        stats['persistent'] = bool(self.url)
+        return stats
+
+
+class _NullCache(LLMCache):
+    """Stand-in used when LLM_CACHE_ENABLED=0; always calls through"""
+
+    def get(self, key):
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def get_or_call(self, provider, model, prompt, params, fn):
+        self.stats['misses'] += 1
+        return llm_guard.call(provider, model, make_key(provider, model, prompt, params), fn)
+
+    async def aget_or_call(self, provider, model, prompt, params, coro_fn):
+        self.stats['misses'] += 1
+        return await llm_guard.acall(provider, model, make_key(provider, model, prompt, params), coro_fn)
+
+
+def _build_cache():
+    if os.getenv('LLM_CACHE_ENABLED', '1').lower() in ('0', 'false', 'no'):
+        return _NullCache()
+    return LLMCache(
+        ttl=float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600)),
+        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1024)),
+        url=os.getenv('LLM_CACHE_URL') or None,
+        persist_max_entries=int(os.getenv('LLM_CACHE_PERSIST_MAX_ENTRIES', 10000)),
+    )
+
+
+llm_cache = _build_cache()
@@ -0,0 +1,334 @@
+"""
+Guards around LLM provider calls
+
+Every provider request made on a cache miss goes through llm_guard, which
+adds three protections:
+
+    Coalescing: identical requests (same cache key) that arrive while one
+        is already in flight wait for its result instead of sending their
+        own, so a note translated by many clients at once costs one call.
+    Concurrency cap: at most LLM_MAX_CONCURRENCY calls per provider and
+        model are in flight; further callers queue, and fail with
+        ProviderBusyError after LLM_QUEUE_TIMEOUT seconds.
+    Circuit breaker: after LLM_BREAKER_FAILURES consecutive failures of a
+        provider and model, calls fail at once with CircuitOpenError for
+        LLM_BREAKER_COOLDOWN seconds instead of waiting through retries.
+        Then one trial call is let through; its success closes the circuit
+        and its failure opens it again.
+
+Sync callers (worker threads) and async callers (any event loop) share
+the same state, so the limits hold per process.
+
+Environment variables:
+    LLM_MAX_CONCURRENCY: Calls in flight per provider and model (default 8, 0 = unlimited)
+    LLM_QUEUE_TIMEOUT: Seconds to wait for a free slot (default 30)
+    LLM_BREAKER_FAILURES: Consecutive failures that open the circuit (default 5, 0 = off)
+    LLM_BREAKER_COOLDOWN: Seconds before a trial call is allowed (default 30)
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+
+from src.metrics import observe_guard
+
+
+class LLMUnavailableError(Exception):
+    """The call was refused without reaching the provider; retry after retry_after seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+class ProviderBusyError(LLMUnavailableError):
+    pass
+
+
+class _Limiter:
+    """Counting semaphore usable from threads and event loops alike"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiters = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot; returns None if one was free, else a Future resolved when a slot is handed over"""
+        with self.lock:
+            if self.active < self.limit:
+                self.active += 1
+                return None
+            waiter = Future()
+            self.waiters.append(waiter)
+            return waiter
+
+    def cancel(self, waiter):
+        """Stop waiting; a slot already handed to waiter is given back"""
+        with self.lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                return
+        self.release()
+
+    def release(self):
+        with self.lock:
+            waiter = self.waiters.popleft() if self.waiters else None
+            if waiter is None:
+                self.active -= 1
+        if waiter is not None:
+            # The slot passes straight to the next caller
+            waiter.set_result(True)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call"""
+
+    def __init__(self, failures, cooldown):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - self.opened_at < self.cooldown else 'half-open'
+
+    def before_call(self, claim=True):
+        """
+        Raise CircuitOpenError unless a call may go ahead
+
+        Args:
+            claim: Take the half-open trial call, if that is what is allowed
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self.trial:
+                raise CircuitOpenError(
+                    f'Provider unavailable after {self.consecutive} consecutive failures; '
+                    f'retry in {max(remaining, 0):.0f}s',
+                    retry_after=max(remaining, 1.0)
+                )
+            if claim:
+                self.trial = True
+
+    def record(self, ok):
+        """Record a call's outcome: True, False, or None if it was abandoned"""
+        with self.lock:
+            self.trial = False
+            if ok is None:
+                return
+            if ok:
+                self.consecutive = 0
+                self.opened_at = None
+                return
+            self.consecutive += 1
+            if self.opened_at is not None or (self.failures and self.consecutive >= self.failures):
+                self.opened_at = time.monotonic()
+
+
+class LLMGuard:
+    """Per-process coalescing, concurrency limits and circuit breakers for provider calls"""
+
+    def __init__(self, max_concurrency=8, queue_timeout=30.0, breaker_failures=5, breaker_cooldown=30.0):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._flights = {}
+        self._limiters = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'coalesced': 0, 'busy': 0, 'circuit_open': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+            queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', 30)),
+            breaker_failures=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+            breaker_cooldown=float(os.getenv('LLM_BREAKER_COOLDOWN', 30)),
+        )
+
+    def _get(self, provider, model):
+        """Return the (limiter, breaker) pair for a provider and model"""
+        key = (provider, model)
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(self.breaker_failures, self.breaker_cooldown)
+                if self.max_concurrency > 0:
+                    self._limiters[key] = _Limiter(self.max_concurrency)
+            return self._limiters.get(key), self._breakers[key]
+
+    def _count(self, provider, model, name):
+        with self._lock:
+            self.stats[name] += 1
+        observe_guard(provider, model, name)
+
+    def _join(self, key):
+        """Return (flight, leader): the in-flight Future for key, and whether this caller must make the call"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Future()
+            return flight, True
+
+    def _land(self, key, flight, value=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(value)
+
+    def _busy(self, provider, model, limiter, waiter):
+        limiter.cancel(waiter)
+        self._count(provider, model, 'busy')
+        return ProviderBusyError(
+            f'Too many concurrent {provider} requests for {model}; gave up after {self.queue_timeout:g}s',
+            retry_after=self.queue_timeout
+        )
+
+    def _check(self, provider, model, breaker, claim):
+        try:
+            breaker.before_call(claim)
+        except CircuitOpenError:
+            self._count(provider, model, 'circuit_open')
+            raise
+
+    @contextmanager
+    def slot(self, provider, model):
+        """Hold a concurrency slot for one provider call, and report its outcome to the breaker"""
+        limiter, breaker = self._get(provider, model)
+        # Fail fast while open rather than queueing first
+        self._check(provider, model, breaker, claim=False)
+        if limiter is not None:
+            waiter = limiter.acquire()
+            if waiter is not None:
+                try:
+                    waiter.result(timeout=self.queue_timeout)
+                except FutureTimeoutError:
+                    raise self._busy(provider, model, limiter, waiter) from None
+        with self._outcome(provider, model, limiter, breaker):
+            yield
+
+    @asynccontextmanager
+    async def aslot(self, provider, model):
+        """Async version of slot(); waiting for a slot doesn't block the event loop"""
+        limiter, breaker = self._get(provider, model)
+        self._check(provider, model, breaker, claim=False)
+        if limiter is not None:
+            waiter = limiter.acquire()
+            if waiter is not None:
+                try:
+                    # shield: a cancelled or timed-out wait must not cancel the shared Future
+                    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    raise self._busy(provider, model, limiter, waiter) from None
+                except asyncio.CancelledError:
+                    limiter.cancel(waiter)
+                    raise
+        with self._outcome(provider, model, limiter, breaker):
+            yield
+
+    @contextmanager
+    def _outcome(self, provider, model, limiter, breaker):
+        try:
+            self._check(provider, model, breaker, claim=True)
+        except CircuitOpenError:
+            if limiter is not None:
+                limiter.release()
+            raise
+        self._count(provider, model, 'calls')
+        ok = None
+        try:
+            yield
+            ok = True
+        except Exception:
+            ok = False
+            raise
+        finally:
+            breaker.record(ok)
+            if limiter is not None:
+                limiter.release()
+
+    def call(self, provider, model, key, fn):
+        """
+        Call fn() under the guard, sharing the result with identical concurrent calls
+
+        Args:
+            provider: Provider name
+            model: Model name
+            key: Cache key identifying the request, or None to not coalesce
+            fn: Zero-argument callable that performs the real request
+
+        Returns:
+            fn()'s result, possibly from another caller's call
+        """
+        if key is None:
+            with self.slot(provider, model):
+                return fn()
+        flight, leader = self._join(key)
+        if not leader:
+            self._count(provider, model, 'coalesced')
+            return flight.result()
+        try:
+            with self.slot(provider, model):
+                value = fn()
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, value)
+        return value
+
+    async def acall(self, provider, model, key, coro_fn):
+        """Async version of call(); coro_fn() returns an awaitable"""
+        if key is None:
+            async with self.aslot(provider, model):
+                return await coro_fn()
+        flight, leader = self._join(key)
+        if not leader:
+            self._count(provider, model, 'coalesced')
+            return await asyncio.shield(asyncio.wrap_future(flight))
+        try:
+            async with self.aslot(provider, model):
+                value = await coro_fn()
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, value)
+        return value
+
+    def snapshot(self):
+        """Return counters plus each provider and model's circuit state and calls in flight"""
+        with self._lock:
+            stats = dict(self.stats)
+            pairs = list(self._breakers.items())
+            stats['in_flight_keys'] = len(self._flights)
+        stats['providers'] = [
+            {
+                'provider': provider, 'model': model, 'circuit': breaker.state,
+                'consecutive_failures': breaker.consecutive,
+                'active': self._limiters[(provider, model)].active if (provider, model) in self._limiters else None,
+            }
+            for (provider, model), breaker in pairs
+        ]
+        return stats
+
+
+llm_guard = LLMGuard.from_env()
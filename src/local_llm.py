@@ -0,0 +1,190 @@
+"""
+Offline LLM provider with deterministic answers
+
+Selected with LLM_PROVIDER=local. It needs no API key or network access
+and answers every prompt from the prompt text alone: extraction prompts
+get structured-notes JSON, translation prompts an echo of the text. That
+makes it useful for tests, demos and load tests of the LLM routes.
+
+To measure how the app behaves against a real provider, it can also
+inject per-attempt latency, random 500 errors and a Hugging Face style
+"model is loading" window during which attempts fail with 503 and an
+estimated_time. Failed attempts are retried with backoff the way
+hf_call_model does, and every attempt is counted in stats(). Streamed
+answers arrive word by word, LOCAL_LLM_TOKEN_MS apart.
+
+Environment variables:
+    LOCAL_LLM_LATENCY_MS: Delay per attempt (default 0)
+    LOCAL_LLM_JITTER_MS: Extra uniformly random delay per attempt (default 0)
+    LOCAL_LLM_ERROR_RATE: Fraction of attempts failing with 500 (default 0)
+    LOCAL_LLM_LOADING_SECONDS: Seconds after the first call during which
+        attempts fail with 503 "model is loading" (default 0)
+    LOCAL_LLM_TOKEN_MS: Delay per generated word (default 0)
+    LOCAL_LLM_RETRIES: Attempts per call (default 3)
+    LOCAL_LLM_BACKOFF: Seconds before the first retry, doubling each time (default 0.1)
+    LOCAL_LLM_SEED: Seed for jitter and injected errors (default 0)
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+from src.llm import LLMProvider
+from src.metrics import observe_llm
+
+# Longest wait between attempts, as HF_BACKOFF_MAX does for Hugging Face
+BACKOFF_MAX = 20
+# A word with its trailing whitespace: the unit of streamed output
+_TOKEN_RE = re.compile(r'\S+\s*|\s+')
+
+
+def structured_note(text):
+    """A plausible extraction result that depends only on the input text"""
+    words = [word.strip('.,!?') for word in text.split() if word.strip('.,!?')]
+    title = ' '.join(words[:4]) or 'Untitled'
+    day = 1 + zlib.crc32(text.encode()) % 28
+    return json.dumps({
+        'Title': title,
+        'Notes': text,
+        'Tags': [word.lower() for word in words[:2]],
+        'Event Date': f'{day:02d}-Nov-2025',
+        'Event Time': '17:00',
+    })
+
+
+def answer(prompt):
+    """Deterministic model output for a generation or chat prompt"""
+    if 'Extract the user' in prompt:
+        # The user's text is quoted on the last "Input:" line of the prompt
+        text = prompt.rsplit('Input: "', 1)[-1].split('"', 1)[0]
+        return structured_note(text)
+    if prompt.startswith(('Translate', 'User: Translate')):
+        # The text to translate follows the first blank line
+        text = prompt.split('\n\n', 1)[-1]
+        return f'[translated] {text.replace("Assistant:", "").strip()}'
+    return f'[generated] {prompt[-80:]}'
+
+
+class ProviderError(Exception):
+    """An injected provider failure"""
+
+    def __init__(self, status, message, estimated_time=None):
+        super().__init__(f'{status} {message}')
+        self.status = status
+        self.estimated_time = estimated_time
+
+
+class LocalProvider(LLMProvider):
+    """In-process provider; arguments override the LOCAL_LLM_* environment variables"""
+    name = 'local'
+    label = 'Local LLM'
+    default_model = 'local-notes'
+
+    def __init__(self, latency=None, jitter=None, error_rate=None, loading_seconds=None,
+                 token_delay=None, retries=None, backoff=None, seed=None):
+        env = os.getenv
+        self.latency = latency if latency is not None else float(env('LOCAL_LLM_LATENCY_MS', 0)) / 1000
+        self.jitter = jitter if jitter is not None else float(env('LOCAL_LLM_JITTER_MS', 0)) / 1000
+        self.error_rate = error_rate if error_rate is not None else float(env('LOCAL_LLM_ERROR_RATE', 0))
+        self.loading_seconds = (loading_seconds if loading_seconds is not None
+                                else float(env('LOCAL_LLM_LOADING_SECONDS', 0)))
+        self.token_delay = (token_delay if token_delay is not None
+                            else float(env('LOCAL_LLM_TOKEN_MS', 0)) / 1000)
+        self.retries = max(1, retries if retries is not None else int(env('LOCAL_LLM_RETRIES', 3)))
+        self.backoff = backoff if backoff is not None else float(env('LOCAL_LLM_BACKOFF', 0.1))
+        self._random = random.Random(seed if seed is not None else int(env('LOCAL_LLM_SEED', 0)))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero the counters and unload the model, so the loading window starts again"""
+        with self._lock:
+            self._loaded_at = None
+            self._stats = {'calls': 0, 'attempts': 0, 'errors': 0, 'loading': 0, 'failed': 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _attempt(self):
+        """Return this attempt's delay and the error it fails with, if any"""
+        with self._lock:
+            self._stats['attempts'] += 1
+            now = time.monotonic()
+            if self._loaded_at is None:
+                self._loaded_at = now + self.loading_seconds
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            if now < self._loaded_at:
+                self._stats['loading'] += 1
+                return delay, ProviderError(503, 'Model is loading', estimated_time=self._loaded_at - now)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self._stats['errors'] += 1
+                return delay, ProviderError(500, 'Internal Server Error')
+            return delay, None
+
+    def _retry_delay(self, attempt, error):
+        delay = self.backoff * (2 ** attempt)
+        if error.estimated_time is not None:
+            # Like _retry_delay in llm_async: wait for the model to finish loading
+            delay = max(delay, error.estimated_time)
+        return min(delay, BACKOFF_MAX)
+
+    def _schedule(self):
+        """Yield the waits of one call's attempts; raise the last attempt's error if all fail"""
+        for attempt in range(self.retries):
+            delay, error = self._attempt()
+            yield delay
+            if error is None:
+                return
+            if attempt == self.retries - 1:
+                raise error
+            yield self._retry_delay(attempt, error)
+
+    def _finish(self, model, start, error):
+        with self._lock:
+            self._stats['calls'] += 1
+            if error is not None:
+                self._stats['failed'] += 1
+        observe_llm(self.name, model, time.perf_counter() - start, 200 if error is None else error.status)
+
+    def _tokens(self, messages):
+        prompt = '\n'.join(message.get('content', '') for message in messages)
+        return _TOKEN_RE.findall(answer(prompt))
+
+    def complete(self, model, messages, params):
+        return ''.join(self.stream(model, messages, params))
+
+    def stream(self, model, messages, params):
+        start = time.perf_counter()
+        error = None
+        try:
+            for delay in self._schedule():
+                time.sleep(delay)
+            for token in self._tokens(messages):
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                yield token
+        except ProviderError as e:
+            error = e
+            raise
+        finally:
+            self._finish(model, start, error)
+
+    async def acomplete(self, model, messages, params):
+        start = time.perf_counter()
+        error = None
+        try:
+            for delay in self._schedule():
+                await asyncio.sleep(delay)
+            tokens = self._tokens(messages)
+            await asyncio.sleep(self.token_delay * len(tokens))
+            return ''.join(tokens)
+        except ProviderError as e:
+            error = e
+            raise
+        finally:
+            self._finish(model, start, error)
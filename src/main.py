@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
@@ -7,10 +8,14 @@ from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 
-def create_app():
+def create_app(config=None):
+    """Build the app; config (e.g. a test database URI) overrides the defaults below"""
     # Set the static folder path
     static_folder = os.path.join(os.path.dirname(__file__), 'static')
     app = Flask(__name__, static_folder=static_folder, static_url_path='/static')
+    # orjson when installed, stdlib json otherwise; both write ISO 8601 datetimes
+    from src.json_provider import make_json_provider
+    app.json = make_json_provider(app)
     app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
     
     # Database configuration
@@ -19,24 +24,17 @@ def create_app():
     if database_url:
         # Use Supabase PostgreSQL (production)
         # Fix for IPv6 issue: add options to force IPv4
-        if 'postgresql://' in database_url or 'postgres://' in database_url:
+        from src.db_config import engine_options, is_postgres
+        # Match on the parsed backend so postgresql+psycopg2:// etc. are covered too
+        if is_postgres(database_url):
             # Ensure sslmode is set for Supabase
             if '?' not in database_url:
                 database_url = f"{database_url}?sslmode=require"
             elif 'sslmode' not in database_url:
                 database_url = f"{database_url}&sslmode=require"
         app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-        # Add engine options for better connection handling
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-            'pool_pre_ping': True,
-            'pool_recycle': 300,
-            'pool_size': 5,
-            'max_overflow': 10,
-            'connect_args': {
-                'sslmode': 'require',
-                'connect_timeout': 10,
-            }
-        }
+        # NullPool on Vercel, a QueuePool elsewhere; see src/db_config.py
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
     elif os.environ.get('VERCEL'):
         # Fallback to ephemeral SQLite in /tmp for Vercel (if DATABASE_URL not set)
         database_path = os.path.join('/tmp', 'notes.db')
@@ -54,6 +52,8 @@ def create_app():
         }
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
     
     # Enable CORS for all routes
     CORS(app)
@@ -61,11 +61,17 @@ def create_app():
     # Initialize database
     db.init_app(app)
     
+    # Request, SQL and serialization timings, served at /api/metrics
+    from src import metrics
+    metrics.init_app(app)
+    
     # Register blueprints
     from src.routes.note import note_bp
     from src.routes.user import user_bp
+    from src.routes.job import job_bp
     app.register_blueprint(note_bp, url_prefix='/api')
     app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(job_bp, url_prefix='/api')
     
     # Register LLM blueprint (optional - works only if API keys are configured)
     try:
@@ -74,13 +80,47 @@ def create_app():
     except Exception as e:
         print(f"Warning: LLM routes not available: {e}")
     
-    # Create database tables within app context (with error handling)
-    try:
-        with app.app_context():
-            db.create_all()
-    except Exception as e:
-        print(f"Warning: Could not create database tables: {e}")
-        # Tables might already exist, which is fine
+    # Create database tables and indexes (with error handling). SCHEMA_INIT picks when:
+    #   startup - while building the app (local default)
+    #   lazy    - on the first request, so importing the app opens no connection
+    #             (default on Vercel's ephemeral /tmp SQLite)
+    #   off     - only via `flask --app src.main init-db` (default on Vercel with
+    #             DATABASE_URL, so cold starts don't run DDL checks against Supabase)
+    default_schema_init = 'startup'
+    if os.environ.get('VERCEL'):
+        default_schema_init = 'off' if database_url else 'lazy'
+    schema_init = app.config.get('SCHEMA_INIT') or os.environ.get('SCHEMA_INIT', default_schema_init)
+    
+    def init_schema():
+        try:
+            from src.migrations import upgrade_schema
+            with app.app_context():
+                upgrade_schema()
+        except Exception as e:
+            print(f"Warning: Could not create database tables: {e}")
+            # Tables might already exist, which is fine
+    
+    if schema_init == 'startup':
+        init_schema()
+    elif schema_init == 'lazy':
+        schema_ready = []
+        schema_lock = threading.Lock()
+        
+        @app.before_request
+        def init_schema_once():
+            if schema_ready:
+                return
+            with schema_lock:
+                if not schema_ready:
+                    init_schema()
+                    schema_ready.append(True)
+    
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create tables and apply schema upgrades"""
+        from src.migrations import upgrade_schema
+        upgrade_schema()
+        print('Database schema is up to date')
     
     # Root route - serve the HTML file
     @app.route('/')
@@ -101,6 +141,8 @@ def create_app():
             'endpoints': {
                 '/api/test': 'Test endpoint',
                 '/api/notes': 'Notes CRUD operations',
+                '/api/jobs/<id>': 'Background job status',
+                '/api/metrics': 'Performance metrics (Prometheus text format)',
                 '/api/users': 'Users CRUD operations'
             }
         })
@@ -119,7 +161,8 @@ def create_app():
             count = Note.query.count()
             db_uri = app.config.get('SQLALCHEMY_DATABASE_URI', 'Not set')
             # Hide password in response
-            if 'postgresql://' in db_uri:
+            from src.db_config import is_postgres
+            if is_postgres(db_uri):
                 db_type = 'PostgreSQL (Supabase)'
                 db_uri_safe = db_uri.split('@')[1] if '@' in db_uri else 'Connected'
             else:
@@ -0,0 +1,254 @@
+"""
+In-process performance metrics, served at /api/metrics in Prometheus text format
+
+init_app() records per-endpoint request latency, SQL statement counts and
+durations (SQLAlchemy engine events), and JSON serialization time. LLM
+calls report their latency through observe_llm() and guard decisions
+through observe_guard(); the LLM cache hit rate and circuit breaker states
+are read from llm_cache and llm_guard at scrape time.
+
+Counters live in this process only; with several workers each one reports
+its own numbers, which Prometheus sums when scraping them all.
+
+Environment variables:
+    METRICS_ENABLED: "0" turns instrumentation and /api/metrics off (default "1")
+    SLOW_REQUEST_MS: Log requests slower than this many milliseconds
+        (default 0, off)
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))
+
+# Upper bounds in seconds; roughly doubling from 1 ms to 30 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+    def _labels(self, key):
+        return _format_labels(self.labelnames, key)
+
+
+class Histogram(Counter):
+    """Cumulative-bucket histogram with labels, as Prometheus expects"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # per-bucket counts (last one is +Inf), sum
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in sorted(self._values.items())]
+        samples = []
+        for key, counts, total in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                samples.append((f'{self.name}_bucket', labels, running))
+            samples.append((f'{self.name}_sum', self._labels(key), total))
+            samples.append((f'{self.name}_count', self._labels(key), running))
+        return samples
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by endpoint',
+    ('method', 'endpoint', 'status')
+)
+SQL_QUERIES = Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time, by statement type',
+    ('statement',)
+)
+SQL_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'Number of SQL statements run while handling a request',
+    ('endpoint',), buckets=(1, 2, 3, 5, 10, 20, 50, 100, 500)
+)
+JSON_SERIALIZE = Histogram('json_serialize_seconds', 'Time spent encoding JSON responses')
+LLM_LATENCY = Histogram(
+    'llm_call_duration_seconds', 'LLM provider call latency (cache misses only)',
+    ('provider', 'model', 'status')
+)
+LLM_GUARD_EVENTS = Counter(
+    'llm_guard_events_total', 'LLM calls made, coalesced, or refused as busy or circuit_open',
+    ('provider', 'model', 'event')
+)
+SLOW_REQUESTS = Counter('http_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS', ('endpoint',))
+
+METRICS = [REQUEST_LATENCY, SQL_QUERIES, SQL_PER_REQUEST, JSON_SERIALIZE, LLM_LATENCY, LLM_GUARD_EVENTS, SLOW_REQUESTS]
+
+
+def observe_llm(provider, model, seconds, status='ok'):
+    """Record one LLM call; status is an HTTP status, "ok" or "error\""""
+    if METRICS_ENABLED:
+        LLM_LATENCY.observe(seconds, provider=provider, model=model, status=status)
+
+
+def observe_guard(provider, model, event_name):
+    if METRICS_ENABLED:
+        LLM_GUARD_EVENTS.inc(provider=provider, model=model, event=event_name)
+
+
+def observe_json(seconds):
+    if METRICS_ENABLED:
+        JSON_SERIALIZE.observe(seconds)
+
+
+def _endpoint():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_sql = [0, 0.0]  # statements, seconds
+
+
+def _after_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = _endpoint()
+    REQUEST_LATENCY.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+    sql_count, sql_time = g.pop('_metrics_sql', (0, 0.0))
+    SQL_PER_REQUEST.observe(sql_count, endpoint=endpoint)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(endpoint=endpoint)
+        print(f"Slow request: {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+              f"in {elapsed * 1000:.1f}ms ({sql_count} SQL statements, {sql_time * 1000:.1f}ms)")
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_metrics_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    SQL_QUERIES.observe(elapsed, statement=statement.lstrip().split(None, 1)[0].upper() if statement.strip() else '')
+    if has_request_context() and '_metrics_sql' in g:
+        g._metrics_sql[0] += 1
+        g._metrics_sql[1] += elapsed
+
+
+def _listen_engine_events():
+    # Listening on the Engine class covers every engine, including ones created later
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _cache_samples():
+    """Gauges for the LLM response cache, read at scrape time"""
+    from src.llm_cache import llm_cache
+    stats = llm_cache.snapshot()
+    lines = [
+        '# HELP llm_cache_hit_ratio Fraction of LLM cache lookups served from cache',
+        '# TYPE llm_cache_hit_ratio gauge',
+        f"llm_cache_hit_ratio {_format_value(float(stats['hit_rate']))}",
+        '# HELP llm_cache_entries Entries in the in-process LLM cache',
+        '# TYPE llm_cache_entries gauge',
+        f"llm_cache_entries {stats['entries']}",
+        '# HELP llm_cache_lookups_total LLM cache lookups by result',
+        '# TYPE llm_cache_lookups_total counter',
+    ]
+    for result in ('memory_hits', 'persistent_hits', 'misses'):
+        lines.append(f'llm_cache_lookups_total{{result="{result}"}} {stats[result]}')
+    return lines
+
+
+def _guard_samples():
+    """Circuit breaker state per provider and model, read at scrape time"""
+    from src.llm_guard import llm_guard
+    lines = [
+        '# HELP llm_circuit_open Whether calls to this provider and model are being refused (1) or not (0)',
+        '# TYPE llm_circuit_open gauge',
+    ]
+    for entry in llm_guard.snapshot()['providers']:
+        labels = _format_labels(('provider', 'model'), (entry['provider'], entry['model']))
+        lines.append(f"llm_circuit_open{labels} {int(entry['circuit'] == 'open')}")
+    return lines
+
+
+def render():
+    """Return every metric in Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+    lines += _cache_samples()
+    lines += _guard_samples()
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Register request hooks, SQL listeners and GET /api/metrics on app"""
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    _listen_engine_events()
+    app.add_url_rule('/api/metrics', 'metrics', metrics_view)
@@ -0,0 +1,125 @@
+"""
+Idempotent schema upgrades
+
+db.create_all() only creates missing tables, so columns and indexes added
+to existing models would never reach databases created by an older version
+(e.g. the Supabase instance). upgrade_schema() fills in that gap and is
+safe to run on every start.
+"""
+from sqlalchemy import bindparam, exists, func, inspect, select, text, update
+from src.models.user import db
+
+
+def _add_missing_columns(conn, table):
+    """ALTER TABLE ... ADD COLUMN for model columns missing in the database; returns their names"""
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    preparer = conn.dialect.identifier_preparer
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        ddl = f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}'
+        if column.server_default is not None:
+            default = column.server_default.arg
+            # String defaults are literals, text() defaults are raw SQL
+            ddl += f" DEFAULT {default.text}" if hasattr(default, 'text') else f" DEFAULT '{default}'"
+        conn.execute(text(ddl))
+        added.append(column.name)
+    return added
+
+
+def _create_missing_indexes(conn, table):
+    for index in table.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+
+def _backfill_note_tags(conn, batch_size=1000):
+    """Link notes that have a tags string but no note_tag rows yet"""
+    from src.models.note import Note
+    from src.models.tag import attach_tags, note_tag
+
+    note_table = Note.__table__
+    untagged = (
+        select(note_table.c.id, note_table.c.tags)
+        .where(note_table.c.tags != '')
+        .where(~exists().where(note_tag.c.note_id == note_table.c.id))
+        .order_by(note_table.c.id)
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(untagged.where(note_table.c.id > last_id).limit(batch_size)).all()
+        if not rows:
+            break
+        attach_tags(conn, [(row.id, row.tags) for row in rows])
+        last_id = rows[-1].id
+
+
+def _backfill_event_at(conn, batch_size=1000):
+    """
+    Parse event_date/event_time into event_at for rows written before it existed
+
+    Only run when the column is added: later writes set event_at themselves,
+    so rows still NULL after this have a date that doesn't parse and are not
+    worth selecting again on every start.
+    """
+    from src.models.note import Note, parse_event_at
+
+    note_table = Note.__table__
+    pending = (
+        select(note_table.c.id, note_table.c.event_date, note_table.c.event_time)
+        .where(note_table.c.event_at.is_(None))
+        .where(note_table.c.event_date != '')
+        .order_by(note_table.c.id)
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(pending.where(note_table.c.id > last_id).limit(batch_size)).all()
+        if not rows:
+            break
+        updates = [
+            {'note_id': row.id, 'event_at': parse_event_at(row.event_date, row.event_time)}
+            for row in rows
+        ]
+        updates = [row for row in updates if row['event_at'] is not None]
+        if updates:
+            # Pin updated_at, or its onupdate would stamp every row with the migration time
+            conn.execute(
+                update(note_table).where(note_table.c.id == bindparam('note_id'))
+                .values(event_at=bindparam('event_at'), updated_at=note_table.c.updated_at),
+                updates
+            )
+        last_id = rows[-1].id
+
+
+def _seed_order_keys(conn):
+    """Give notes distinct order keys; newest first if none were ever set"""
+    from src.models.note import Note
+    from src.ordering import rebalance
+
+    note_table = Note.__table__
+    distinct, total = conn.execute(
+        select(func.count(note_table.c.order_index.distinct()), func.count())
+    ).one()
+    if distinct < total:
+        # A single shared key means a database from before manual ordering
+        rebalance(conn, by_recent=distinct == 1)
+
+
+def upgrade_schema():
+    """Create tables, then add any columns, indexes and search structures they lack"""
+    # Import models so their tables are registered on db.metadata
+    from src.models import embedding, job, note, tag, user  # noqa: F401
+    from src.search import install_search_index
+
+    db.create_all()
+    with db.engine.begin() as conn:
+        added = {}
+        for table in db.metadata.sorted_tables:
+            added[table.name] = _add_missing_columns(conn, table)
+            _create_missing_indexes(conn, table)
+        install_search_index(conn)
+        _backfill_note_tags(conn)
+        if 'event_at' in added['note']:
+            _backfill_event_at(conn)
+        _seed_order_keys(conn)
@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import String, Integer, DateTime, ForeignKey, LargeBinary, Index
+from src.models.user import db
+
+class NoteEmbedding(db.Model):
+    """Embedding of a note's title and content, as a float32 blob"""
+    __tablename__ = 'note_embedding'
+    __table_args__ = (
+        # The in-process vector index pulls rows written since its last sync
+        Index('ix_note_embedding_model_updated_at', 'model', 'updated_at'),
+    )
+
+    note_id: Mapped[int] = mapped_column(Integer, ForeignKey('note.id', ondelete='CASCADE'), primary_key=True)
+    # Embedder name, e.g. "hashing-512"; rows from another embedder are ignored and redone
+    model: Mapped[str] = mapped_column(String(100), primary_key=True)
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<NoteEmbedding {self.note_id} {self.model}>'
@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import Optional
+import json
+import uuid
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import String, Text, DateTime, Index
+from src.models.user import db
+
+class Job(db.Model):
+    """A unit of background work (e.g. async /api/generate-note) and its outcome"""
+    __tablename__ = 'job'
+    __table_args__ = (
+        Index('ix_job_status_created_at', 'status', 'created_at'),
+    )
+    
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload: Mapped[str] = mapped_column(Text, nullable=False, default='{}')
+    result: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Process that owns the job ("host:pid"), and when it last confirmed it is still alive
+    worker: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -1,11 +1,49 @@
-from datetime import datetime
-from typing import Optional
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Text, Integer, DateTime
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
+from sqlalchemy import String, Text, Integer, DateTime, Index, delete, event, insert, inspect
 from src.models.user import db
+from src.models.tag import Tag, get_tag_ids, note_tag, parse_tags
+
+# Formats accepted for event_date; the first is what extraction produces
+EVENT_DATE_FORMATS = ('%d-%b-%Y', '%Y-%m-%d', '%d/%m/%Y')
+EVENT_TIME_FORMATS = ('%H:%M', '%H:%M:%S')
+
+def parse_event_at(event_date, event_time=''):
+    """
+    Combine the free-form event_date/event_time strings into a datetime
+
+    Returns:
+        datetime (midnight if there is no time), or None if the date is
+        missing or not in a recognised format
+    """
+    event_date = (event_date or '').strip()
+    if not event_date:
+        return None
+    for date_format in EVENT_DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(event_date, date_format)
+            break
+        except ValueError:
+            continue
+    else:
+        return None
+    for time_format in EVENT_TIME_FORMATS:
+        try:
+            clock = datetime.strptime((event_time or '').strip(), time_format)
+            return parsed.replace(hour=clock.hour, minute=clock.minute, second=clock.second)
+        except ValueError:
+            continue
+    return parsed
 
 class Note(db.Model):
     __tablename__ = 'note'
+    __table_args__ = (
+        # Keyset pagination on GET /api/notes walks this index in order
+        Index('ix_note_updated_at_id', 'updated_at', 'id'),
+        # Manual order (?sort=position) and neighbour lookups when moving a note
+        Index('ix_note_order_index_id', 'order_index', 'id'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -13,9 +51,19 @@ class Note(db.Model):
     tags: Mapped[Optional[str]] = mapped_column(String(500), nullable=True, default='')
     event_date: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, default='')
     event_time: Mapped[Optional[str]] = mapped_column(String(20), nullable=True, default='')
+    # Parsed from event_date/event_time on every write; indexed for range queries
+    event_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
+    # Sparse manual-order key, see src/ordering.py; new notes are placed on top
     order_index: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Bumped by every content write; PATCH and PUT refuse a stale version with 409
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default='1', nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Normalized copy of tags, kept in sync by _sync_note_tags below
+    tag_objects: Mapped[List[Tag]] = relationship(Tag, secondary=note_tag)
+
+    # ORM updates and deletes check and bump version; src/autosave.py does the same in SQL
+    __mapper_args__ = {'version_id_col': version}
     
     def __repr__(self):
         return f'<Note {self.title}>'
@@ -28,8 +76,71 @@ class Note(db.Model):
             'tags': self.tags,
             'event_date': self.event_date,
             'event_time': self.event_time,
+            'event_at': self.event_at.isoformat() if self.event_at else None,
             'order_index': self.order_index,
+            'version': self.version,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+    @staticmethod
+    def row_to_dict(row):
+        """Dict for a Row of selected Note columns, without per-field formatting
+
+        Datetimes are left as-is; the app's JSON provider (src/json_provider.py)
+        writes them as ISO 8601, the same as to_dict().
+        """
+        return row._asdict()
+
+class NoteTombstone(db.Model):
+    """Record of a deleted note, so delta sync can tell clients to drop it"""
+    __tablename__ = 'note_tombstone'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    note_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class NoteRebalance(db.Model):
+    """Record of every order key being renumbered, so delta sync can tell clients to resync"""
+    __tablename__ = 'note_rebalance'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    rebalanced_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+# Tombstones older than this are pruned; sync tokens older than it must resync
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+@event.listens_for(Note, 'after_delete')
+def _record_tombstone(mapper, connection, target):
+    now = datetime.utcnow()
+    tombstones = NoteTombstone.__table__
+    connection.execute(insert(tombstones).values(note_id=target.id, deleted_at=now))
+    connection.execute(delete(tombstones).where(tombstones.c.deleted_at < now - TOMBSTONE_RETENTION))
+
+@event.listens_for(Session, 'before_flush')
+def _sync_derived_columns(session, flush_context, instances):
+    """Keep note_tag and event_at in step with the strings they derive from"""
+    new_notes = [obj for obj in session.new if isinstance(obj, Note)]
+    dirty_notes = [obj for obj in session.dirty if isinstance(obj, Note)]
+    
+    unplaced = [note for note in new_notes if note.order_index is None]
+    if unplaced:
+        from src.ordering import top_keys
+        with session.no_autoflush:
+            for note, key in zip(unplaced, top_keys(session, len(unplaced))):
+                note.order_index = key
+    
+    def changed(note, *attrs):
+        state = inspect(note)
+        return any(state.attrs[attr].history.has_changes() for attr in attrs)
+    
+    for note in new_notes + [note for note in dirty_notes if changed(note, 'event_date', 'event_time')]:
+        note.event_at = parse_event_at(note.event_date, note.event_time)
+    
+    retagged = new_notes + [note for note in dirty_notes if changed(note, 'tags')]
+    if not retagged:
+        return
+    with session.no_autoflush:
+        ids = get_tag_ids(session, {name for note in retagged for name in parse_tags(note.tags)})
+        for note in retagged:
+            note.tag_objects = [session.get(Tag, ids[name]) for name in parse_tags(note.tags)]
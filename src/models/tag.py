@@ -0,0 +1,90 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Table, insert, select
+from src.models.user import db
+
+# Longest tag name kept; longer tags are truncated
+MAX_TAG_LENGTH = 100
+
+# Association between notes and their normalized tags
+note_tag = Table(
+    'note_tag', db.metadata,
+    Column('note_id', Integer, ForeignKey('note.id', ondelete='CASCADE'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    # The primary key serves lookups by note; this one serves filtering by tag
+    Index('ix_note_tag_tag_id_note_id', 'tag_id', 'note_id'),
+)
+
+class Tag(db.Model):
+    __tablename__ = 'tag'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(MAX_TAG_LENGTH), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name
+        }
+
+def parse_tags(tags):
+    """Split a comma-separated tags string into unique, lower-cased tag names"""
+    names = []
+    for name in (tags or '').split(','):
+        name = name.strip().lower()[:MAX_TAG_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def _insert_ignoring_duplicates(connection, table):
+    """INSERT that skips rows another transaction created since we looked (ON CONFLICT DO NOTHING)"""
+    bind = connection.get_bind() if hasattr(connection, 'get_bind') else connection
+    if bind.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing()
+
+def get_tag_ids(connection, names):
+    """
+    Return {name: id} for the given tag names, creating missing tags
+
+    Args:
+        connection: SQLAlchemy Session or Connection
+        names: Iterable of normalized tag names
+    """
+    names = set(names)
+    if not names:
+        return {}
+    tag_table = Tag.__table__
+    ids = dict(connection.execute(
+        select(tag_table.c.name, tag_table.c.id).where(tag_table.c.name.in_(names))
+    ).all())
+    missing = names - ids.keys()
+    if missing:
+        connection.execute(_insert_ignoring_duplicates(connection, tag_table), [{'name': name} for name in missing])
+        ids.update(connection.execute(
+            select(tag_table.c.name, tag_table.c.id).where(tag_table.c.name.in_(missing))
+        ).all())
+    return ids
+
+def attach_tags(connection, note_tags):
+    """
+    Link freshly inserted notes to their tags in a few set-based statements
+
+    Used where notes are written without the ORM (bulk import, backfill);
+    existing links for these notes are left alone.
+
+    Args:
+        connection: SQLAlchemy Session or Connection
+        note_tags: List of (note_id, tags string) pairs
+    """
+    parsed = [(note_id, parse_tags(tags)) for note_id, tags in note_tags]
+    ids = get_tag_ids(connection, {name for _, names in parsed for name in names})
+    rows = [{'note_id': note_id, 'tag_id': ids[name]} for note_id, names in parsed for name in names]
+    if rows:
+        connection.execute(insert(note_tag), rows)
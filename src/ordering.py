@@ -0,0 +1,246 @@
+"""
+Sparse ordering keys for manual (drag-and-drop) note order
+
+Notes are shown by ascending order_index, ties broken by newest id. Keys are
+spaced ORDER_GAP apart, so moving a note only rewrites that note's key: it
+takes the midpoint between its new neighbours. When two neighbours have no
+integer left between them the whole list is renumbered once (rebalance) and
+the move is retried.
+
+New notes go to the top: they take a key ORDER_GAP below the current minimum.
+
+Moving a note bumps its updated_at like any other edit, so delta sync picks
+it up. A rebalance leaves updated_at alone (stamping every note would tie the
+whole recency list) and is recorded instead; sync tokens from before it must
+resync.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+
+ORDER_GAP = 1024
+# order_index is a 32-bit INTEGER on PostgreSQL; renumber well before it overflows
+MIN_KEY = -(2 ** 30)
+
+
+def _note_table():
+    from src.models.note import Note
+    return Note.__table__
+
+
+def position_order():
+    """ORDER BY clauses for listing notes in manual order"""
+    note = _note_table()
+    return note.c.order_index, note.c.id.desc()
+
+
+def rebalance(session, by_recent=False):
+    """
+    Renumber every note ORDER_GAP apart in one UPDATE, keeping the current order
+
+    Args:
+        session: Session or Connection to run the update on
+        by_recent: Order by most recently updated instead (used once to seed
+            keys on databases created before ordering existed)
+
+    updated_at is left untouched; only the spacing of the keys changes. The
+    rebalance is recorded in note_rebalance so /notes/changes can send delta
+    sync clients, which wouldn't see any note change, back to a full sync.
+    """
+    from src.models.note import NoteRebalance, TOMBSTONE_RETENTION
+
+    note = _note_table()
+    if by_recent:
+        order_by = (note.c.updated_at.desc(), note.c.id.desc())
+    else:
+        order_by = position_order()
+    ranked = select(
+        note.c.id.label('note_id'),
+        (func.row_number().over(order_by=order_by) * ORDER_GAP).label('key')
+    ).subquery()
+    session.execute(
+        update(note)
+        .where(note.c.id == ranked.c.note_id)
+        .values(order_index=ranked.c.key, updated_at=note.c.updated_at)
+    )
+    now = datetime.utcnow()
+    rebalances = NoteRebalance.__table__
+    session.execute(insert(rebalances).values(rebalanced_at=now))
+    session.execute(delete(rebalances).where(rebalances.c.rebalanced_at < now - TOMBSTONE_RETENTION))
+
+
+def top_keys(session, count=1):
+    """
+    Return count distinct keys above every existing note, topmost first
+
+    Args:
+        session: Session or Connection
+        count: Number of keys needed (e.g. one per note in a bulk insert)
+
+    Returns:
+        List of ints, ascending, each below the current minimum key
+    """
+    note = _note_table()
+    lowest = session.execute(select(func.min(note.c.order_index))).scalar()
+    if lowest is None:
+        lowest = 0
+    elif lowest - ORDER_GAP * count < MIN_KEY:
+        rebalance(session)
+        lowest = ORDER_GAP
+    return [lowest - ORDER_GAP * (count - i) for i in range(count)]
+
+
+def _neighbour(session, key, ref_id, below, moving_id, pending):
+    """
+    Key of the note displayed right after (below=True) or before note ref_id
+
+    Notes already moved in this batch are read from pending (id -> new key)
+    rather than the database, and the note being moved is ignored.
+    """
+    note = _note_table()
+    if below:
+        position = or_(note.c.order_index > key, and_(note.c.order_index == key, note.c.id < ref_id))
+        order_by = (note.c.order_index, note.c.id.desc())
+    else:
+        position = or_(note.c.order_index < key, and_(note.c.order_index == key, note.c.id > ref_id))
+        order_by = (note.c.order_index.desc(), note.c.id)
+    skip_ids = set(pending) | {moving_id}
+    row = session.execute(
+        select(note.c.order_index, note.c.id)
+        .where(position, note.c.id.not_in(skip_ids))
+        .order_by(*order_by).limit(1)
+    ).first()
+    # Compare (key, -id) tuples: ascending key, then newest id first
+    ref = (key, -ref_id)
+    candidates = [(row.order_index, -row.id)] if row else []
+    candidates += [
+        (other_key, -other_id) for other_id, other_key in pending.items()
+        if other_id != moving_id and ((other_key, -other_id) > ref if below else (other_key, -other_id) < ref)
+    ]
+    if not candidates:
+        return None
+    return (min if below else max)(candidates)[0]
+
+
+def _edge(session, first, moving_id, pending):
+    """Lowest (first=True) or highest key in the list, ignoring the note being moved"""
+    note = _note_table()
+    aggregate = func.min if first else func.max
+    skip_ids = set(pending) | {moving_id}
+    keys = [key for other_id, key in pending.items() if other_id != moving_id]
+    stored = session.execute(select(aggregate(note.c.order_index)).where(note.c.id.not_in(skip_ids))).scalar()
+    if stored is not None:
+        keys.append(stored)
+    if not keys:
+        return None
+    return min(keys) if first else max(keys)
+
+
+def _place(session, move, current, pending):
+    """Return the new key for one move, or None if there is no room and a rebalance is needed"""
+    note_id = move['id']
+    if 'position' in move:
+        first = move['position'] == 'first'
+        edge = _edge(session, first, note_id, pending)
+        if edge is None:
+            return 0
+        return edge - ORDER_GAP if first else edge + ORDER_GAP
+    below = 'after' in move
+    target_id = move['after'] if below else move['before']
+    target_key = pending.get(target_id, current[target_id])
+    other = _neighbour(session, target_key, target_id, below, note_id, pending)
+    if other is None:
+        return target_key + ORDER_GAP if below else target_key - ORDER_GAP
+    low, high = (target_key, other) if below else (other, target_key)
+    if high - low < 2:
+        return None
+    return low + (high - low) // 2
+
+
+def parse_moves(data):
+    """
+    Validate a list of moves from a request body, or raise ValueError
+
+    Each move is {"id": n, "after": m}, {"id": n, "before": m} or
+    {"id": n, "position": "first" | "last"}.
+    """
+    if not isinstance(data, list) or not data:
+        raise ValueError('moves must be a non-empty list')
+    moves = []
+    for index, move in enumerate(data):
+        if not isinstance(move, dict) or not isinstance(move.get('id'), int):
+            raise ValueError(f'Move {index}: id is required')
+        anchors = [key for key in ('after', 'before', 'position') if key in move]
+        if len(anchors) != 1:
+            raise ValueError(f'Move {index}: give exactly one of after, before or position')
+        anchor = anchors[0]
+        if anchor == 'position':
+            if move['position'] not in ('first', 'last'):
+                raise ValueError(f'Move {index}: position must be "first" or "last"')
+        elif not isinstance(move[anchor], int):
+            raise ValueError(f'Move {index}: {anchor} must be a note id')
+        elif move[anchor] == move['id']:
+            raise ValueError(f'Move {index}: a note cannot move relative to itself')
+        moves.append({'id': move['id'], anchor: move[anchor]})
+    return moves
+
+
+def apply_moves(session, moves):
+    """
+    Apply moves in order and write every changed key with one UPDATE ... CASE
+
+    Args:
+        session: Session or Connection; the caller commits
+        moves: Output of parse_moves()
+
+    Returns:
+        (dict of note id -> new key, whether the list had to be rebalanced)
+
+    Raises:
+        LookupError: if a move references a note that does not exist
+    """
+    note = _note_table()
+    ids = {move['id'] for move in moves} | {move.get('after', move.get('before')) for move in moves}
+    ids.discard(None)
+    current = dict(session.execute(
+        select(note.c.id, note.c.order_index).where(note.c.id.in_(ids))
+    ).all())
+    missing = sorted(ids - set(current))
+    if missing:
+        raise LookupError(f'Note {missing[0]} not found')
+
+    pending = {}
+    rebalanced = False
+    for move in moves:
+        key = _place(session, move, current, pending)
+        if key is None:
+            # Write what we have, respace everything, then re-read the keys
+            write_keys(session, pending)
+            rebalance(session)
+            rebalanced = True
+            current = dict(session.execute(
+                select(note.c.id, note.c.order_index).where(note.c.id.in_(ids))
+            ).all())
+            pending = {}
+            key = _place(session, move, current, pending)
+        pending[move['id']] = key
+    write_keys(session, pending)
+    if rebalanced:
+        # Moves made before the rebalance were renumbered along with everything else
+        moved = {move['id'] for move in moves}
+        pending = dict(session.execute(
+            select(note.c.id, note.c.order_index).where(note.c.id.in_(moved))
+        ).all())
+    return pending, rebalanced
+
+
+def write_keys(session, keys):
+    """UPDATE note SET order_index = CASE id WHEN ... END for every id in keys"""
+    if not keys:
+        return
+    note = _note_table()
+    session.execute(
+        update(note)
+        .where(note.c.id.in_(list(keys)))
+        .values(order_index=case(keys, value=note.c.id))
+    )
@@ -0,0 +1,319 @@
+"""
+Rule-based extraction of event dates, times and tags
+
+Runs before the LLM on every structured-notes request. It resolves the
+relative and absolute dates and times people type into quick captures
+("tmr 5pm", "next Friday 3:30pm", "18 Oct", "noon") using the same
+conventions as the LLM prompt: dates as dd-mmm-yyyy (18-Oct-2025) and
+times as HH:MM on a 24-hour clock. A keyword list supplies tags.
+
+A short English input that resolves completely is answered without the
+LLM (see ExtractionPlan in src/llm.py). For anything else the results
+are passed to the model so it can skip the date arithmetic, and a
+shorter prompt is used.
+
+Environment variables:
+    QUICK_EXTRACT: "0" always uses the LLM with the full prompt (default "1")
+    QUICK_EXTRACT_MAX_WORDS: Longest input answered without the LLM (default 8)
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+QUICK_EXTRACT_ENABLED = os.getenv('QUICK_EXTRACT', '1').lower() not in ('0', 'false', 'no')
+QUICK_EXTRACT_MAX_WORDS = int(os.getenv('QUICK_EXTRACT_MAX_WORDS', 8))
+
+DATE_FORMAT = '%d-%b-%Y'
+TIME_FORMAT = '%H:%M'
+
+_MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+_MONTH = (r'(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+          r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?')
+_WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+# Full names, plus abbreviations that aren't also common words ("sat", "sun", "wed")
+_WEEKDAY = (r'(monday|tuesday|wednesday|thursday|friday|saturday|sunday'
+            r'|mon|tues?|thu(?:rs?)?|fri)\b\.?')
+_NUMBERS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+            'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10}
+_COUNT = r'(\d{1,2}|an?|one|two|three|four|five|six|seven|eight|nine|ten)'
+
+# Words that mean the input says more about timing than the rules understood
+_TEMPORAL_WORDS = {
+    'next', 'last', 'after', 'before', 'until', 'till', 'every', 'each', 'ago', 'later',
+    'week', 'weeks', 'weekend', 'month', 'months', 'year', 'years', 'daily', 'weekly', 'monthly',
+    'oclock', "o'clock", 'sat', 'sun', 'wed',
+}
+_STOPWORDS = {
+    'a', 'an', 'the', 'at', 'on', 'in', 'to', 'for', 'with', 'and', 'or', 'of', 'my', 'me',
+    'i', 'we', 'you', 'is', 'are', 'be', 'will', 'need', 'go', 'have', 'has', 'do', 'remember',
+}
+
+# Keyword -> category; a match tags the note with both, as in the prompt's examples
+TAG_KEYWORDS = {
+    'sports': ('badminton', 'football', 'soccer', 'basketball', 'tennis', 'volleyball', 'swim',
+               'swimming', 'gym', 'run', 'running', 'jog', 'yoga', 'hike', 'hiking', 'cycling'),
+    'meeting': ('meeting', 'meet', 'call', 'standup', 'sync', 'interview', 'catchup'),
+    'study': ('exam', 'quiz', 'lecture', 'class', 'tutorial', 'homework', 'assignment', 'lab',
+              'revision', 'study', 'seminar', 'midterm', 'thesis'),
+    'work': ('deadline', 'report', 'project', 'presentation', 'client', 'submit', 'review'),
+    'food': ('lunch', 'dinner', 'breakfast', 'brunch', 'coffee', 'cafe', 'restaurant', 'dim sum'),
+    'health': ('doctor', 'dentist', 'clinic', 'hospital', 'appointment', 'medicine', 'checkup'),
+    'shopping': ('buy', 'shopping', 'groceries', 'grocery', 'supermarket', 'order'),
+    'travel': ('flight', 'train', 'trip', 'airport', 'hotel', 'travel', 'ferry'),
+    'social': ('party', 'birthday', 'wedding', 'drinks', 'concert', 'movie', 'date'),
+    'bills': ('rent', 'bill', 'bills', 'pay', 'payment', 'invoice'),
+}
+_KEYWORD_CATEGORY = {keyword: category for category, keywords in TAG_KEYWORDS.items() for keyword in keywords}
+_KEYWORD_RE = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, _KEYWORD_CATEGORY), key=len, reverse=True)) + r')\b')
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def _count(value):
+    return int(value) if value.isdigit() else _NUMBERS[value]
+
+
+def _upcoming(today, weekday):
+    """The next date falling on weekday, today included"""
+    return today + timedelta(days=(weekday - today.weekday()) % 7)
+
+
+def _weekday_date(today, qualifier, name):
+    weekday = _WEEKDAYS[name[:3]]
+    if qualifier == 'last':
+        return today - timedelta(days=(today.weekday() - weekday - 1) % 7 + 1)
+    date = _upcoming(today, weekday)
+    if qualifier == 'next':
+        # "next Friday" means the one in the coming week, not later this week
+        days_left_this_week = 6 - today.weekday()
+        if (date - today).days <= days_left_this_week:
+            date += timedelta(days=7)
+    return date
+
+
+def _calendar_date(today, day, month, year=None):
+    day, month = int(day), int(month)
+    if year:
+        year = int(year)
+        year = year + 2000 if year < 100 else year
+        return today.replace(year=year, month=month, day=day)
+    date = today.replace(month=month, day=day)
+    if (today - date).days > 180:
+        # "5 Jan" typed in December is next January
+        date = date.replace(year=today.year + 1)
+    return date
+
+
+# (pattern, handler(match, today)) in priority order; a match overlapping
+# one found by an earlier rule is skipped
+_DATE_RULES = [
+    (r'\bday after (?:tomorrow|tmrw?|tmw)\b', lambda m, t: t + timedelta(days=2)),
+    (r'\b(?:today|tdy|tonight|this (?:morning|afternoon|evening))\b', lambda m, t: t),
+    (r'\b(?:tomorrow|tomorow|tommorow|tmrw?|tmw)\b', lambda m, t: t + timedelta(days=1)),
+    (r'\b(?:yesterday|ytd)\b', lambda m, t: t - timedelta(days=1)),
+    (r'\bnext week\b', lambda m, t: t + timedelta(days=7)),
+    (rf'\bin {_COUNT} (day|week)s?\b',
+     lambda m, t: t + timedelta(days=_count(m.group(1)) * (7 if m.group(2) == 'week' else 1))),
+    (rf'\b(?:(this|next|last|on) )?{_WEEKDAY}', lambda m, t: _weekday_date(t, m.group(1), m.group(2))),
+    (r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b', lambda m, t: _calendar_date(t, m.group(3), m.group(2), m.group(1))),
+    (rf'\b(\d{{1,2}})(?:st|nd|rd|th)?[ -]{_MONTH}(?:[ ,-]+(\d{{4}}))?\b',
+     lambda m, t: _calendar_date(t, m.group(1), _MONTHS[m.group(2)[:3]], m.group(3))),
+    (rf'\b{_MONTH} (\d{{1,2}})(?:st|nd|rd|th)?(?:,? (\d{{4}}))?\b',
+     lambda m, t: _calendar_date(t, m.group(2), _MONTHS[m.group(1)[:3]], m.group(3))),
+    # Day first, as written in Hong Kong and the UK
+    (r'\b(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})\b', lambda m, t: _calendar_date(t, m.group(1), m.group(2), m.group(3))),
+]
+# A bare day/month is as often a fraction or a number ("1/2 kg", "room 5/12"),
+# so it only counts as a date after a cue word or next to a time
+_SHORT_DATE_RULES = [
+    (r'\b(\d{1,2})/(\d{1,2})\b', lambda m, t: _calendar_date(t, m.group(1), m.group(2))),
+]
+_SHORT_DATE_CUE_RE = re.compile(r'\b(?:on|by|due)\s*$')
+_ADJACENT_RE = re.compile(r'\s*(?:,|at|@)?\s*')
+
+
+def _clock(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError('hour out of range')
+        hour = hour % 12 + (12 if meridiem.startswith('p') else 0)
+    return datetime(2000, 1, 1, hour, minute)
+
+
+_TIME_RULES = [
+    (r'\b(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)(?![a-z])', lambda m: _clock(m.group(1), m.group(2), m.group(3))),
+    (r'\b([01]?\d|2[0-3]):([0-5]\d)\b', lambda m: _clock(m.group(1), m.group(2), None)),
+    (r'\b(?:noon|midday)\b', lambda m: _clock(12, 0, None)),
+    (r'\bmidnight\b', lambda m: _clock(0, 0, None)),
+]
+
+_DATE_RULES = [(re.compile(pattern), handler) for pattern, handler in _DATE_RULES]
+_TIME_RULES = [(re.compile(pattern), handler) for pattern, handler in _TIME_RULES]
+_SHORT_DATE_RULES = [(re.compile(pattern), handler) for pattern, handler in _SHORT_DATE_RULES]
+# "at 5" or "5 o'clock" without am/pm: the hour is ambiguous
+_AMBIGUOUS_TIME_RE = re.compile(r"\b(?:at|@) ?\d{1,2}\b(?![:.]?\d|\s*(?:(?:am|pm|a\.m\.|p\.m\.)(?![a-z])|/|-))|\bo'?clock\b")
+# Words joining a date or time to the rest of the sentence, dropped along with it
+_CONNECTOR_RE = re.compile(r'(?:\b(?:at|on|by|from|this)|@)\s*$', re.IGNORECASE)
+
+
+class QuickExtraction:
+    """
+    What the rules found in one input
+
+    Attributes:
+        event_date: dd-mmm-yyyy, or "" if none was found
+        event_time: HH:MM, or "" if none was found
+        tags: Up to 3 tags
+        title: Up to 4 words of the input without its date and time
+        notes: The input as a sentence
+        unresolved: True if the input has timing the rules didn't understand,
+            more than one date or time, or a day/month that may not be a date
+        word_count: Words in the input
+    """
+
+    def __init__(self, text, event_date, event_time, tags, title, unresolved):
+        self.text = text
+        self.event_date = event_date
+        self.event_time = event_time
+        self.tags = tags
+        self.title = title
+        self.unresolved = unresolved
+        self.word_count = len(_WORD_RE.findall(text))
+
+    @property
+    def notes(self):
+        notes = ' '.join(self.text.split())
+        if not notes:
+            return ''
+        notes = notes[0].upper() + notes[1:]
+        return notes if notes[-1] in '.!?' else notes + '.'
+
+    @property
+    def has_when(self):
+        return bool(self.event_date or self.event_time)
+
+    @property
+    def complete(self):
+        """True when this alone answers the request, without the LLM"""
+        return (self.has_when and not self.unresolved and bool(self.title)
+                and self.word_count <= QUICK_EXTRACT_MAX_WORDS)
+
+    def as_structured(self):
+        """The fields in the LLM's response format"""
+        return {
+            'Title': self.title,
+            'Notes': self.notes,
+            'Tags': self.tags,
+            'Event Date': self.event_date,
+            'Event Time': self.event_time,
+        }
+
+
+def _find(rules, lowered, claimed, today=None):
+    """Apply rules; return (values, spans), skipping matches that overlap a claimed span"""
+    values, spans = [], []
+    for pattern, handler in rules:
+        for match in pattern.finditer(lowered):
+            start, end = match.span()
+            if any(start < e and s < end for s, e in claimed + spans):
+                continue
+            try:
+                value = handler(match, today) if today is not None else handler(match)
+            except (ValueError, KeyError):
+                # e.g. 31/02 or 13pm: not a date or time after all
+                continue
+            values.append(value)
+            spans.append((start, end))
+    return values, spans
+
+
+def _cued(lowered, span, time_spans):
+    """True if the short date at span follows a cue word or sits next to a time"""
+    start, end = span
+    if _SHORT_DATE_CUE_RE.search(lowered[:start]):
+        return True
+    return any(
+        (end <= s and _ADJACENT_RE.fullmatch(lowered[end:s])) or (e <= start and _ADJACENT_RE.fullmatch(lowered[e:start]))
+        for s, e in time_spans
+    )
+
+
+def suggest_tags(text, limit=3):
+    """Keyword tags for text, each followed by its category: ["badminton", "sports"]"""
+    tags = []
+    for match in _KEYWORD_RE.finditer(text.lower()):
+        for tag in (match.group(1), _KEYWORD_CATEGORY[match.group(1)]):
+            if tag not in tags:
+                tags.append(tag)
+    return tags[:limit]
+
+
+def _title(text, spans):
+    """Up to 4 words of text with the date and time spans (and words like "at" before them) removed"""
+    pieces, last = [], 0
+    for start, end in sorted(spans):
+        before = _CONNECTOR_RE.sub('', text[last:start])
+        pieces.append(before)
+        last = end
+    pieces.append(text[last:])
+    rest = ' '.join(''.join(pieces).replace('@', ' at ').split())
+    words = [word.strip('.,!?;:-') for word in rest.split()]
+    words = [word for word in words if word]
+    while words and words[-1].lower() in _STOPWORDS:
+        words.pop()
+    title = ' '.join(words[:4])
+    return title[:1].upper() + title[1:]
+
+
+def quick_extract(text, now=None):
+    """
+    Find the event date, time and tags in text with rules alone
+
+    Args:
+        text: The user's input
+        now: Reference time for relative dates (default: now, local time)
+
+    Returns:
+        QuickExtraction
+    """
+    today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    lowered = text.lower()
+    dates, date_spans = _find(_DATE_RULES, lowered, [], today)
+    times, time_spans = _find(_TIME_RULES, lowered, date_spans)
+    short_dates, short_spans = _find(_SHORT_DATE_RULES, lowered, date_spans + time_spans, today)
+    unresolved = False
+    for date, span in zip(short_dates, short_spans):
+        if _cued(lowered, span, time_spans):
+            dates.append(date)
+            date_spans.append(span)
+        else:
+            unresolved = True
+    spans = date_spans + time_spans
+
+    unique_dates = {date.strftime(DATE_FORMAT) for date in dates}
+    unique_times = {clock.strftime(TIME_FORMAT) for clock in times}
+    unresolved = unresolved or len(unique_dates) > 1 or len(unique_times) > 1
+
+    # Anything time-like left outside the matched spans is beyond the rules
+    remainder = ''.join(' ' if any(s <= i < e for s, e in spans) else ch for i, ch in enumerate(lowered))
+    if _AMBIGUOUS_TIME_RE.search(remainder) or set(_WORD_RE.findall(remainder)) & _TEMPORAL_WORDS:
+        unresolved = True
+
+    title = _title(text, spans)
+    tags = suggest_tags(text)
+    if not tags and title:
+        # No keyword: fall back on the first content word, as a model would
+        words = [word.lower() for word in _WORD_RE.findall(title) if word.lower() not in _STOPWORDS]
+        tags = words[:1]
+
+    return QuickExtraction(
+        text,
+        event_date=unique_dates.pop() if len(unique_dates) == 1 else '',
+        event_time=unique_times.pop() if len(unique_times) == 1 else '',
+        tags=tags,
+        title=title,
+        unresolved=unresolved,
+    )
@@ -0,0 +1,19 @@
+from flask import Blueprint, jsonify
+from src.jobs import get_job
+from src.models.note import Note, db
+
+job_bp = Blueprint('job', __name__)
+
+@job_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Poll a background job; includes the created note once it succeeded"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = job.to_dict()
+    result = response['result'] or {}
+    if job.status == 'succeeded' and 'note_id' in result:
+        note = db.session.get(Note, result['note_id'])
+        response['note'] = note.to_dict() if note else None
+    return jsonify(response)
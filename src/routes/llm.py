@@ -1,12 +1,67 @@
-from flask import Blueprint, jsonify, request
-from src.llm import translate, extract_structured_notes
+from flask import Blueprint, current_app, jsonify, request
+from src.jobs import QueueFullError, job_handler, submit_job
+from src.llm_cache import llm_cache
+from src.llm_guard import LLMUnavailableError, llm_guard
 from src.models.note import Note, db
+from src.streaming import JSONFieldStream, sse_event, sse_response, wants_stream
 import json
 
 llm_bp = Blueprint('llm', __name__)
 
+def _llm():
+    """src.llm_async, imported on first use so cold starts skip aiohttp, requests and dotenv"""
+    from src import llm_async
+    return llm_async
+
+# Maximum number of texts accepted by the /batch endpoints
+MAX_BATCH_ITEMS = 100
+
+# LLM views are async: the provider call is awaited on the shared LLM event
+# loop (see src/llm_async.py) instead of blocking inside the handler.
+# With stream=true, translate and extract answer with server-sent events
+# instead (see src/streaming.py); the stream is read on the worker thread.
+
+def _unavailable(e):
+    """503 with Retry-After for calls the LLM guard refused (open circuit or full queue)"""
+    return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+
+def _error_event(e):
+    data = {'error': str(e)}
+    if isinstance(e, LLMUnavailableError):
+        data['retry_after'] = round(e.retry_after)
+    return sse_event('error', data)
+
+def _translate_events(text, target_language):
+    from src import llm
+    pieces = []
+    try:
+        for piece in llm.stream_translate(text, target_language):
+            pieces.append(piece)
+            yield sse_event('token', {'text': piece})
+        yield sse_event('done', {'translated_text': ''.join(pieces).strip()})
+    except Exception as e:
+        yield _error_event(e)
+
+def _extract_events(text, language):
+    from src import llm
+    parser = JSONFieldStream()
+    pieces = []
+    try:
+        plan = llm.ExtractionPlan(text, language)
+        for piece in llm.stream_structured_notes(plan):
+            pieces.append(piece)
+            for name, value in parser.feed(piece):
+                yield sse_event('field', {'name': name, 'value': plan.field(name, value)})
+        raw_response = plan.finish(''.join(pieces))
+        try:
+            yield sse_event('done', json.loads(raw_response))
+        except json.JSONDecodeError:
+            yield sse_event('error', {'error': 'Failed to parse structured notes', 'raw_response': raw_response})
+    except Exception as e:
+        yield _error_event(e)
+
 @llm_bp.route('/translate', methods=['POST'])
-def translate_text():
+async def translate_text():
     """Translate text to target language"""
     try:
         data = request.json
@@ -15,15 +70,19 @@ def translate_text():
         
         text = data['text']
         target_language = data['target_language']
+        if wants_stream(data, request.args):
+            return sse_response(_translate_events(text, target_language))
         
-        translated_text = translate(text, target_language)
+        translated_text = await _llm().atranslate(text, target_language)
         
         return jsonify({'translated_text': translated_text})
+    except LLMUnavailableError as e:
+        return _unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @llm_bp.route('/extract-structured-notes', methods=['POST'])
-def extract_notes():
+async def extract_notes():
     """Extract structured notes from text"""
     try:
         data = request.json
@@ -32,8 +91,10 @@ def extract_notes():
         
         text = data['text']
         language = data.get('language', 'English')
+        if wants_stream(data, request.args):
+            return sse_response(_extract_events(text, language))
         
-        structured_notes_json = extract_structured_notes(text, language)
+        structured_notes_json = await _llm().aextract_structured_notes(text, language)
         
         # Parse the JSON response from LLM
         try:
@@ -46,12 +107,93 @@ def extract_notes():
                 'raw_response': structured_notes_json
             }), 500
             
+    except LLMUnavailableError as e:
+        return _unavailable(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _batch_texts(data):
+    """Return the list of texts from a batch request body, or raise ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object with "texts"')
+    texts = data.get('texts')
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise ValueError('texts must be a list of strings')
+    if len(texts) > MAX_BATCH_ITEMS:
+        raise ValueError(f'At most {MAX_BATCH_ITEMS} texts per batch')
+    return texts
+
+@llm_bp.route('/translate/batch', methods=['POST'])
+async def translate_batch():
+    """Translate many texts; results are in input order with per-item errors"""
+    data = request.get_json(silent=True)
+    try:
+        texts = _batch_texts(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if 'target_language' not in data:
+        return jsonify({'error': 'target_language is required'}), 400
+    
+    outputs = await _llm().atranslate_batch(texts, data['target_language'])
+    results = [
+        {'error': str(output)} if isinstance(output, Exception) else {'translated_text': output}
+        for output in outputs
+    ]
+    return jsonify({'results': results})
+
+@llm_bp.route('/extract-structured-notes/batch', methods=['POST'])
+async def extract_notes_batch():
+    """Extract structured notes from many texts; per-item errors in input order"""
+    data = request.get_json(silent=True)
+    try:
+        texts = _batch_texts(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    outputs = await _llm().aextract_structured_notes_batch(texts, data.get('language', 'English'))
+    results = []
+    for output in outputs:
+        if isinstance(output, Exception):
+            results.append({'error': str(output)})
+            continue
+        try:
+            results.append(json.loads(output))
+        except json.JSONDecodeError:
+            results.append({'error': 'Failed to parse structured notes', 'raw_response': output})
+    return jsonify({'results': results})
+
+def note_from_structured(structured_data, input_text):
+    """Build (but don't add) a Note from parsed structured-notes JSON"""
+    return Note(
+        title=structured_data.get('Title', 'Untitled'),
+        content=structured_data.get('Notes', input_text),
+        tags=', '.join(structured_data.get('Tags', [])) if isinstance(structured_data.get('Tags'), list) else structured_data.get('Tags', ''),
+        event_date=structured_data.get('Event Date', ''),
+        event_time=structured_data.get('Event Time', '')
+    )
+
+@job_handler('generate_note')
+def generate_note_job(payload):
+    """Background version of /generate-note; runs on the job worker pool"""
+    from src.llm import extract_structured_notes
+    structured_notes_json = extract_structured_notes(payload['input_text'], payload['language'])
+    try:
+        structured_data = json.loads(structured_notes_json)
+    except json.JSONDecodeError:
+        raise ValueError(f'Failed to parse LLM response: {structured_notes_json}')
+    
+    note = note_from_structured(structured_data, payload['input_text'])
+    db.session.add(note)
+    db.session.commit()
+    return {'note_id': note.id}
+
 @llm_bp.route('/generate-note', methods=['POST'])
-def generate_note():
-    """Generate a note from user input text"""
+async def generate_note():
+    """Generate a note from user input text
+
+    With "async": true (or ?async=true) the work is queued and 202 is
+    returned with a job id to poll at /api/jobs/<id>.
+    """
     try:
         data = request.json
         if not data or 'input_text' not in data:
@@ -60,8 +202,18 @@ def generate_note():
         input_text = data['input_text']
         language = data.get('language', 'English')
         
+        run_async = data.get('async') is True or request.args.get('async', '').lower() in ('1', 'true', 'yes')
+        if run_async:
+            try:
+                job = submit_job(current_app._get_current_object(), 'generate_note',
+                                 {'input_text': input_text, 'language': language})
+            except QueueFullError as e:
+                return jsonify({'error': str(e)}), 429
+            status_url = f'/api/jobs/{job.id}'
+            return jsonify({'job_id': job.id, 'status': job.status, 'status_url': status_url}), 202, {'Location': status_url}
+        
         # Extract structured notes from input
-        structured_notes_json = extract_structured_notes(input_text, language)
+        structured_notes_json = await _llm().aextract_structured_notes(input_text, language)
         
         # Parse the JSON response from LLM
         try:
@@ -70,19 +222,25 @@ def generate_note():
             return jsonify({'error': 'Failed to parse LLM response', 'raw_response': structured_notes_json}), 500
         
         # Create a new note with the extracted data
-        note = Note(
-            title=structured_data.get('Title', 'Untitled'),
-            content=structured_data.get('Notes', input_text),
-            tags=', '.join(structured_data.get('Tags', [])) if isinstance(structured_data.get('Tags'), list) else structured_data.get('Tags', ''),
-            event_date=structured_data.get('Event Date', ''),
-            event_time=structured_data.get('Event Time', '')
-        )
+        note = note_from_structured(structured_data, input_text)
         
         db.session.add(note)
         db.session.commit()
         
         return jsonify(note.to_dict()), 201
         
+    except LLMUnavailableError as e:
+        return _unavailable(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+
+@llm_bp.route('/llm/cache', methods=['GET'])
+def llm_cache_stats():
+    """Hit/miss counters for the LLM response cache"""
+    return jsonify(llm_cache.snapshot())
+
+@llm_bp.route('/llm/guard', methods=['GET'])
+def llm_guard_stats():
+    """Coalescing and rejection counters, plus circuit state per provider and model"""
+    return jsonify(llm_guard.snapshot())
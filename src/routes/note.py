@@ -1,13 +1,301 @@
-from flask import Blueprint, jsonify, request
-from src.models.note import Note, db
+import base64
+import hashlib
+import json
+import zlib
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.orm.exc import StaleDataError
+from src.autosave import VersionConflictError, parse_patch, patch_note, save_coalescer
+from src.models.note import Note, NoteRebalance, NoteTombstone, TOMBSTONE_RETENTION, db, parse_event_at
+from src.models.tag import Tag, attach_tags, note_tag, parse_tags
+from src.ordering import apply_moves, parse_moves, position_order, top_keys
+from src.search import search_note_ids
+from src.semantic_search import EMBED_ON_WRITE, search_similar, store_embeddings
 
 note_bp = Blueprint('note', __name__)
 
+# Columns a client may ask for with ?fields=
+NOTE_FIELDS = ('id', 'title', 'content', 'tags', 'event_date', 'event_time',
+               'event_at', 'order_index', 'version', 'created_at', 'updated_at')
+# Listing these columns (rather than Note) skips ORM hydration entirely
+NOTE_COLUMNS = [getattr(Note, name) for name in NOTE_FIELDS]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Rows fetched per round trip while exporting (server-side cursor on PostgreSQL)
+EXPORT_BATCH_SIZE = 500
+# Rows inserted per transaction by POST /api/notes/bulk
+DEFAULT_IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_BATCH_SIZE = 5000
+
+def _encode_cursor(updated_at, note_id):
+    raw = json.dumps([updated_at.isoformat(), note_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """Return (updated_at, id) from an opaque cursor, or raise ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        updated_at, note_id = json.loads(raw)
+        return datetime.fromisoformat(updated_at), int(note_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def _parse_fields(fields_arg):
+    """Return the requested column names (id always included), or raise ValueError"""
+    if not fields_arg:
+        return list(NOTE_FIELDS)
+    fields = ['id']
+    for name in fields_arg.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in NOTE_FIELDS:
+            raise ValueError(f'Unknown field: {name}')
+        fields.append(name)
+    return fields
+
+def _tag_filter():
+    """
+    Return a WHERE clause for ?tag= (repeatable or comma-separated), or None
+
+    ?tag_mode=all (default) keeps notes having every tag, ?tag_mode=any
+    keeps notes having at least one.
+    """
+    names = []
+    for value in request.args.getlist('tag'):
+        names += [name for name in parse_tags(value) if name not in names]
+    if not names:
+        return None
+    matching = select(note_tag.c.note_id).join(Tag, Tag.id == note_tag.c.tag_id).where(Tag.name.in_(names))
+    if request.args.get('tag_mode', 'all').lower() != 'any':
+        matching = matching.group_by(note_tag.c.note_id).having(func.count() == len(names))
+    return Note.id.in_(matching)
+
+def _make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+def _list_etag():
+    """ETag for list responses from max(updated_at), row count, key sum and last delete
+
+    Cheap aggregates instead of serializing anything; the order_index sum
+    catches a rebalance, which respaces keys without touching updated_at. The
+    query string is mixed in because filters and projections change the body.
+    """
+    latest, count, key_sum = db.session.execute(
+        select(func.max(Note.updated_at), func.count(Note.id), func.sum(Note.order_index))
+    ).one()
+    last_delete = db.session.execute(select(func.max(NoteTombstone.id))).scalar()
+    return _make_etag(latest, count, key_sum, last_delete, request.query_string.decode())
+
+def _with_etag(etag, response):
+    """Send 304 instead if the client's If-None-Match already has this ETag"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
 @note_bp.route('/notes', methods=['GET'])
 def get_notes():
-    """Get all notes, ordered by most recently updated"""
-    notes = Note.query.order_by(Note.updated_at.desc()).all()
-    return jsonify([note.to_dict() for note in notes])
+    """Get notes, ordered by most recently updated (or manual order with ?sort=position)
+
+    Without paging arguments the full list is returned as before. With any of
+    limit, cursor or fields the response is one page:
+    {"notes": [...], "next_cursor": "..." or null}
+    Both forms can be filtered with ?tag=work&tag=urgent&tag_mode=all|any.
+    """
+    paged = any(arg in request.args for arg in ('limit', 'cursor', 'fields'))
+    sort = request.args.get('sort', 'updated')
+    if sort not in ('updated', 'position'):
+        return jsonify({'error': 'sort must be "updated" or "position"'}), 400
+    if sort == 'position' and paged:
+        return jsonify({'error': 'sort=position is only supported without paging'}), 400
+    
+    etag = _list_etag()
+    if request.if_none_match.contains(etag):
+        return _with_etag(etag, None)
+    
+    tag_filter = _tag_filter()
+    if not paged:
+        if sort == 'position':
+            stmt = select(*NOTE_COLUMNS).order_by(*position_order())
+        else:
+            stmt = select(*NOTE_COLUMNS).order_by(Note.updated_at.desc(), Note.id.desc())
+        if tag_filter is not None:
+            stmt = stmt.where(tag_filter)
+        rows = db.session.execute(stmt)
+        return _with_etag(etag, jsonify([Note.row_to_dict(row) for row in rows]))
+
+    try:
+        fields = _parse_fields(request.args.get('fields'))
+        cursor = request.args.get('cursor')
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+    # updated_at is needed for the next cursor even if the client didn't ask for it
+    columns = [getattr(Note, name) for name in fields]
+    if 'updated_at' not in fields:
+        columns.append(Note.updated_at)
+    stmt = select(*columns).order_by(Note.updated_at.desc(), Note.id.desc()).limit(limit + 1)
+    if after:
+        stmt = stmt.where(tuple_(Note.updated_at, Note.id) < tuple_(*after))
+    if tag_filter is not None:
+        stmt = stmt.where(tag_filter)
+    rows = db.session.execute(stmt).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].updated_at, rows[-1].id)
+    notes = []
+    for row in rows:
+        note = Note.row_to_dict(row)
+        if 'updated_at' not in fields:
+            note.pop('updated_at')
+        notes.append(note)
+    return _with_etag(etag, jsonify({'notes': notes, 'next_cursor': next_cursor}))
+
+# Overlap between consecutive sync windows, so a write that committed while the
+# previous changes query ran is sent again rather than missed
+SYNC_OVERLAP = timedelta(seconds=5)
+
+def _encode_sync_token(moment):
+    return base64.urlsafe_b64encode(json.dumps({'t': moment.isoformat()}).encode()).decode().rstrip('=')
+
+def _decode_sync_token(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        return datetime.fromisoformat(json.loads(raw)['t'])
+    except Exception:
+        raise ValueError('Invalid sync token')
+
+@note_bp.route('/notes/changes', methods=['GET'])
+def get_changes():
+    """Delta sync: notes updated and ids deleted since ?since=<token>
+
+    Without since, every note is returned (initial sync). Clients should
+    apply "deleted" before "notes" and keep "next_token" for the next call.
+    Notes near the window edge may be sent twice; applying them is idempotent.
+    A token older than the tombstone retention, or than the last renumbering
+    of every order key (which changes no updated_at), gets 410 and must resync.
+    """
+    now = datetime.utcnow()
+    since = request.args.get('since')
+    stmt = select(*NOTE_COLUMNS).order_by(Note.updated_at, Note.id)
+    deleted = []
+    if since:
+        try:
+            since_at = _decode_sync_token(since)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if now - since_at > TOMBSTONE_RETENTION:
+            return jsonify({'error': 'Sync token expired, resync without since'}), 410
+        last_rebalance = db.session.execute(select(func.max(NoteRebalance.rebalanced_at))).scalar()
+        if last_rebalance is not None and last_rebalance > since_at:
+            return jsonify({'error': 'Note order was renumbered, resync without since'}), 410
+        stmt = stmt.where(Note.updated_at > since_at)
+        deleted = db.session.execute(
+            select(NoteTombstone.note_id).where(NoteTombstone.deleted_at > since_at).distinct()
+        ).scalars().all()
+    rows = db.session.execute(stmt)
+    return jsonify({
+        'notes': [Note.row_to_dict(row) for row in rows],
+        'deleted': deleted,
+        'next_token': _encode_sync_token(now - SYNC_OVERLAP)
+    })
+
+def _parse_range_bound(value):
+    """Parse a ?from=/?to= value; returns (datetime, is_date_only) or raises ValueError"""
+    try:
+        return datetime.fromisoformat(value), 'T' not in value and ' ' not in value
+    except ValueError:
+        parsed = parse_event_at(value)
+        if parsed is None:
+            raise ValueError(f'Invalid date: {value}')
+        return parsed, True
+
+@note_bp.route('/notes/events', methods=['GET'])
+def get_events():
+    """Notes whose event falls in [from, to], soonest first
+
+    from/to accept ISO dates or datetimes (or dd-mmm-yyyy); a date-only "to"
+    includes that whole day. At most ?limit= (default and max 200) notes are
+    returned. Served by an index range scan on event_at.
+    """
+    if not request.args.get('from') or not request.args.get('to'):
+        return jsonify({'error': 'from and to are required'}), 400
+    try:
+        start, _ = _parse_range_bound(request.args['from'])
+        end, end_is_date = _parse_range_bound(request.args['to'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if end_is_date:
+        end += timedelta(days=1)
+    else:
+        end += timedelta(microseconds=1)
+    
+    limit = max(1, min(request.args.get('limit', MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    
+    rows = db.session.execute(
+        select(*NOTE_COLUMNS)
+        .where(Note.event_at >= start, Note.event_at < end)
+        .order_by(Note.event_at, Note.id)
+        .limit(limit)
+    )
+    return jsonify([Note.row_to_dict(row) for row in rows])
+
+@note_bp.route('/tags', methods=['GET'])
+def get_tags():
+    """List tags with the number of notes using each, most used first"""
+    count = func.count(note_tag.c.note_id)
+    rows = db.session.execute(
+        select(Tag.name, count.label('count'))
+        .join(note_tag, note_tag.c.tag_id == Tag.id)
+        .group_by(Tag.id, Tag.name)
+        .order_by(count.desc(), Tag.name)
+    ).all()
+    return jsonify([{'name': row.name, 'count': row.count} for row in rows])
+
+@note_bp.route('/notes/export', methods=['GET'])
+def export_notes():
+    """Stream every note as newline-delimited JSON (gzip with ?gzip=1)
+
+    Rows are read in batches of EXPORT_BATCH_SIZE and written out as they
+    arrive, so memory use does not grow with the number of notes.
+    """
+    use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    stmt = (
+        select(*NOTE_COLUMNS)
+        .order_by(Note.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    dumps = current_app.json.dumps
+
+    def generate_lines():
+        for partition in db.session.execute(stmt).partitions():
+            yield ''.join(dumps(Note.row_to_dict(row)) + '\n' for row in partition).encode()
+
+    def generate_gzip():
+        # wbits=31 writes a gzip header so the output is a regular .gz file
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in generate_lines():
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    if use_gzip:
+        body, mimetype, filename = generate_gzip(), 'application/gzip', 'notes.ndjson.gz'
+    else:
+        body, mimetype, filename = generate_lines(), 'application/x-ndjson', 'notes.ndjson'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @note_bp.route('/notes', methods=['POST'])
 def create_note():
@@ -31,21 +319,158 @@ def create_note():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _validate_import_row(data):
+    """Return insert values for one imported note, or raise ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Each note must be a JSON object')
+    title, content = data.get('title'), data.get('content')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError('Title is required')
+    if len(title) > 200:
+        raise ValueError('Title must be at most 200 characters')
+    if not isinstance(content, str):
+        raise ValueError('Content is required')
+    tags = data.get('tags') or ''
+    if isinstance(tags, list):
+        tags = ', '.join(str(tag) for tag in tags)
+    values = {
+        'title': title,
+        'content': content,
+        'tags': tags,
+        'event_date': data.get('event_date') or '',
+        'event_time': data.get('event_time') or '',
+    }
+    for key in ('tags', 'event_date', 'event_time'):
+        if not isinstance(values[key], str):
+            raise ValueError(f'{key} must be a string')
+    values['event_at'] = parse_event_at(values['event_date'], values['event_time'])
+    return values
+
+def _iter_import_rows():
+    """Yield (index, parsed row or exception) from a JSON array or NDJSON body"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        # Read line by line so large uploads are never held in memory at once
+        index = 0
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError as e:
+                yield index, ValueError(f'Invalid JSON: {e}')
+            index += 1
+        return
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of notes or an NDJSON body')
+    yield from enumerate(data)
+
+@note_bp.route('/notes/bulk', methods=['POST'])
+def bulk_import_notes():
+    """Import many notes at once, one transaction per batch
+
+    Invalid rows are reported in "errors" by input position and skipped; the
+    rest of the import carries on.
+    """
+    batch_size = max(1, min(request.args.get('batch_size', DEFAULT_IMPORT_BATCH_SIZE, type=int),
+                            MAX_IMPORT_BATCH_SIZE))
+    imported = 0
+    errors = []
+    batch, batch_indexes = [], []
+
+    def flush():
+        nonlocal imported
+        try:
+            # New notes go on top of the manual order, the batch's first row topmost
+            for row, key in zip(batch, top_keys(db.session, len(batch))):
+                row['order_index'] = key
+            note_ids = db.session.execute(
+                insert(Note).returning(Note.id, sort_by_parameter_order=True), batch
+            ).scalars().all()
+            attach_tags(db.session, [(note_id, row['tags']) for note_id, row in zip(note_ids, batch)])
+            if EMBED_ON_WRITE:
+                store_embeddings(db.session, [(note_id, row['title'], row['content'])
+                                              for note_id, row in zip(note_ids, batch)])
+            db.session.commit()
+            imported += len(batch)
+        except Exception as e:
+            db.session.rollback()
+            errors.extend({'index': index, 'error': str(e)} for index in batch_indexes)
+        batch.clear()
+        batch_indexes.clear()
+
+    try:
+        for index, data in _iter_import_rows():
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                batch.append(_validate_import_row(data))
+                batch_indexes.append(index)
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                flush()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if batch:
+        flush()
+
+    return jsonify({'imported': imported, 'failed': len(errors), 'errors': errors})
+
+@note_bp.route('/notes/order', methods=['PATCH'])
+def reorder_notes():
+    """Apply drag-and-drop moves in one transaction
+
+    Body: {"moves": [{"id": 3, "after": 7}, {"id": 5, "before": 2},
+    {"id": 9, "position": "first"}]}, applied in order. Only the moved notes
+    get new keys. Returns {"order": {id: order_index}, "rebalanced": bool};
+    when rebalanced is true every key changed and clients should refetch
+    GET /api/notes?sort=position.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        moves = parse_moves(data.get('moves'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        keys, rebalanced = apply_moves(db.session, moves)
+        db.session.commit()
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'order': keys, 'rebalanced': rebalanced})
+
 @note_bp.route('/notes/<int:note_id>', methods=['GET'])
 def get_note(note_id):
-    """Get a specific note by ID"""
+    """Get a specific note by ID (304 if the client's ETag is current)"""
+    updated_at = db.session.execute(select(Note.updated_at).where(Note.id == note_id)).scalar()
+    if updated_at is None:
+        abort(404)
+    etag = _make_etag(note_id, updated_at)
+    if request.if_none_match.contains(etag):
+        return _with_etag(etag, None)
     note = Note.query.get_or_404(note_id)
-    return jsonify(note.to_dict())
+    return _with_etag(etag, jsonify(note.to_dict()))
+
+def _conflict(current):
+    """409 with the note as it is now, so the client can merge or reload"""
+    return jsonify({'error': 'Note was changed elsewhere', 'note': current}), 409
 
 @note_bp.route('/notes/<int:note_id>', methods=['PUT'])
 def update_note(note_id):
-    """Update a specific note"""
+    """Update a specific note (409 if "version" is sent and is no longer current)"""
     try:
         note = Note.query.get_or_404(note_id)
         data = request.json
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
+        if data.get('version') is not None and data['version'] != note.version:
+            return _conflict(note.to_dict())
         
         note.title = data.get('title', note.title)
         note.content = data.get('content', note.content)
@@ -54,10 +479,47 @@ def update_note(note_id):
         note.event_time = data.get('event_time', note.event_time)
         db.session.commit()
         return jsonify(note.to_dict())
+    except StaleDataError:
+        # Another write got in between loading the note and saving it
+        db.session.rollback()
+        return _conflict(Note.query.get_or_404(note_id).to_dict())
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@note_bp.route('/notes/<int:note_id>', methods=['PATCH'])
+def patch_note_fields(note_id):
+    """Partially update a note for autosave
+
+    Only the fields sent are written, in one UPDATE without reading the note
+    first. With "version" (from the last response for this note) a note
+    changed since gets 409 with its current state instead of being
+    overwritten; the response carries the new version. Saves of the same
+    note arriving while one is being written are merged (see src/autosave.py).
+    """
+    try:
+        fields, version = parse_patch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def write(fields, version, count):
+        try:
+            note = patch_note(db.session, note_id, fields, version, count)
+            db.session.commit()
+            return note
+        except Exception:
+            db.session.rollback()
+            raise
+
+    try:
+        return jsonify(save_coalescer.save(note_id, fields, version, write))
+    except VersionConflictError as e:
+        return _conflict(e.current)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @note_bp.route('/notes/<int:note_id>', methods=['DELETE'])
 def delete_note(note_id):
     """Delete a specific note"""
@@ -72,14 +534,46 @@ def delete_note(note_id):
 
 @note_bp.route('/notes/search', methods=['GET'])
 def search_notes():
-    """Search notes by title or content"""
+    """Search notes by title or content, best match first
+
+    Bare words match as prefixes, "quoted text" matches as a phrase.
+    """
     query = request.args.get('q', '')
     if not query:
         return jsonify([])
-    
-    notes = Note.query.filter(
-        (Note.title.contains(query)) | (Note.content.contains(query))
-    ).order_by(Note.updated_at.desc()).all()
-    
-    return jsonify([note.to_dict() for note in notes])
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
 
+    note_ids = search_note_ids(db.session, query, limit=limit)
+    if note_ids is None:
+        # No full-text index on this database, fall back to a LIKE scan
+        rows = db.session.execute(
+            select(*NOTE_COLUMNS).where(
+                (Note.title.contains(query)) | (Note.content.contains(query))
+            ).order_by(Note.updated_at.desc()).limit(limit)
+        )
+        return jsonify([Note.row_to_dict(row) for row in rows])
+
+    rows = db.session.execute(select(*NOTE_COLUMNS).where(Note.id.in_(note_ids))) if note_ids else []
+    notes_by_id = {row.id: Note.row_to_dict(row) for row in rows}
+    return jsonify([notes_by_id[note_id] for note_id in note_ids if note_id in notes_by_id])
+
+@note_bp.route('/notes/semantic-search', methods=['GET'])
+def semantic_search_notes():
+    """Notes closest in meaning to ?q=, each with a similarity "score", best first"""
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify([])
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    try:
+        matches = search_similar(db.session, query, limit=limit)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    scores = dict(matches)
+    rows = db.session.execute(select(*NOTE_COLUMNS).where(Note.id.in_(list(scores)))) if scores else []
+    notes_by_id = {row.id: Note.row_to_dict(row) for row in rows}
+    results = []
+    for note_id, score in matches:
+        if note_id in notes_by_id:
+            results.append(dict(notes_by_id[note_id], score=round(score, 4)))
+    return jsonify(results)
@@ -1,12 +1,13 @@
 from flask import Blueprint, jsonify, request
+from sqlalchemy import select
 from src.models.user import User, db
 
 user_bp = Blueprint('user', __name__)
 
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    rows = db.session.execute(select(User.id, User.username, User.email))
+    return jsonify([row._asdict() for row in rows])
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
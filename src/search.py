@@ -0,0 +1,203 @@
+"""
+Full-text search index for notes
+
+SQLite databases (local and /tmp on Vercel) use an FTS5 external-content
+table kept in sync by triggers. PostgreSQL (Supabase) uses a generated
+tsvector column with a GIN index. Any other backend, or a SQLite build
+without FTS5, falls back to the old LIKE scan.
+"""
+import re
+from sqlalchemy import text
+
+# Quoted phrases or bare words (optionally ending in *)
+_QUERY_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Relative weight of a title match versus a content match
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5(
+        title, content,
+        content='note', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS note_fts_ai AFTER INSERT ON note BEGIN
+        INSERT INTO note_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS note_fts_ad AFTER DELETE ON note BEGIN
+        INSERT INTO note_fts(note_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS note_fts_au AFTER UPDATE OF title, content ON note BEGIN
+        INSERT INTO note_fts(note_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO note_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+]
+
+_POSTGRES_DDL = [
+    """
+    ALTER TABLE note ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_note_search_vector ON note USING GIN (search_vector)",
+]
+
+# Cache of engine url -> backend name ('fts5', 'tsvector' or 'like')
+_backends = {}
+
+
+def parse_query(query):
+    """
+    Split a user query into search terms
+
+    Quoted text becomes a phrase; every bare word is treated as a prefix so
+    results keep up with the user while they type.
+
+    Args:
+        query: Raw query string from the search box
+
+    Returns:
+        List of (words, is_phrase) tuples; words are sanitized \\w+ tokens
+    """
+    terms = []
+    for phrase, word in _QUERY_TOKEN_RE.findall(query or ''):
+        words = _WORD_RE.findall(phrase if phrase else word)
+        if not words:
+            continue
+        if phrase:
+            terms.append((words, True))
+        else:
+            # "foo-bar" is split by the tokenizer, so search it as a phrase too
+            terms.append((words, len(words) > 1))
+    return terms
+
+
+def to_fts5_query(terms):
+    """Build an FTS5 MATCH expression: phrases quoted, words prefix-matched"""
+    parts = []
+    for words, is_phrase in terms:
+        if is_phrase:
+            parts.append('"' + ' '.join(words) + '"')
+        else:
+            parts.append(f'"{words[0]}"*')
+    return ' '.join(parts)
+
+
+def to_tsquery(terms):
+    """Build a to_tsquery() expression: phrases with <->, words with :*"""
+    parts = []
+    for words, is_phrase in terms:
+        if is_phrase:
+            parts.append('(' + ' <-> '.join(words) + ')')
+        else:
+            parts.append(f'{words[0]}:*')
+    return ' & '.join(parts)
+
+
+def install_search_index(conn):
+    """
+    Create the full-text index for the connection's dialect (idempotent)
+
+    Args:
+        conn: SQLAlchemy connection inside a transaction
+
+    Returns:
+        Name of the search backend now in use
+    """
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        existed = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_fts'"
+        )).first() is not None
+        try:
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+        except Exception as e:
+            print(f"Warning: SQLite FTS5 not available, search will use LIKE: {e}")
+            return _remember(conn, 'like')
+        if not existed:
+            # Index notes that were written before the FTS table existed
+            conn.execute(text("INSERT INTO note_fts(note_fts) VALUES ('rebuild')"))
+        return _remember(conn, 'fts5')
+    if dialect == 'postgresql':
+        for statement in _POSTGRES_DDL:
+            conn.execute(text(statement))
+        return _remember(conn, 'tsvector')
+    return _remember(conn, 'like')
+
+
+def _remember(conn, backend):
+    _backends[str(conn.engine.url)] = backend
+    return backend
+
+
+def search_backend(session):
+    """Return the search backend available on the session's database"""
+    engine = session.get_bind()
+    key = str(engine.url)
+    if key not in _backends:
+        backend = 'like'
+        if engine.dialect.name == 'postgresql':
+            found = session.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'note' AND column_name = 'search_vector'"
+            )).first()
+            backend = 'tsvector' if found else 'like'
+        elif engine.dialect.name == 'sqlite':
+            found = session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_fts'"
+            )).first()
+            backend = 'fts5' if found else 'like'
+        _backends[key] = backend
+    return _backends[key]
+
+
+def search_note_ids(session, query, limit=50):
+    """
+    Find note ids matching a query, best match first
+
+    Args:
+        session: SQLAlchemy session
+        query: Raw query string (supports "quoted phrases" and prefixes)
+        limit: Maximum number of ids to return
+
+    Returns:
+        List of note ids ranked by relevance, or None when no full-text
+        index is available and the caller should fall back to LIKE
+    """
+    terms = parse_query(query)
+    if not terms:
+        return []
+
+    backend = search_backend(session)
+    if backend == 'fts5':
+        rows = session.execute(text(
+            "SELECT rowid FROM note_fts WHERE note_fts MATCH :q "
+            "ORDER BY bm25(note_fts, :title_weight, :content_weight) LIMIT :limit"
+        ), {
+            'q': to_fts5_query(terms),
+            'title_weight': TITLE_WEIGHT,
+            'content_weight': CONTENT_WEIGHT,
+            'limit': limit,
+        })
+    elif backend == 'tsvector':
+        rows = session.execute(text(
+            "SELECT id FROM note, to_tsquery('simple', :q) AS query "
+            "WHERE search_vector @@ query "
+            "ORDER BY ts_rank(search_vector, query) DESC, updated_at DESC LIMIT :limit"
+        ), {'q': to_tsquery(terms), 'limit': limit})
+    else:
+        return None
+    return [row[0] for row in rows]
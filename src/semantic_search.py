@@ -0,0 +1,243 @@
+"""
+Semantic search over note embeddings
+
+Every note write also stores an embedding of its title and content (see
+src/embeddings.py) in note_embedding. Each process keeps an in-memory
+VectorIndex of those vectors and answers queries by brute-force cosine
+similarity: one matrix-vector product with NumPy, a dot product per note
+without it.
+
+The index is loaded once, then kept current incrementally: each search
+first pulls embeddings written since the last sync (other workers may have
+written them) and drops notes that have a tombstone since then. Notes
+with no embedding for the current embedder, e.g. written before this
+existed or before EMBEDDER changed, are embedded in small batches.
+
+Environment variables:
+    EMBED_ON_WRITE: "0" skips embedding on note writes; notes are then
+        embedded by the backfill when searched (default "1")
+"""
+import heapq
+import operator
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, exists, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from src.embeddings import from_blob, get_embedder, note_text, np, to_blob
+from src.models.embedding import NoteEmbedding
+from src.models.note import Note, NoteTombstone
+
+EMBED_ON_WRITE = os.getenv('EMBED_ON_WRITE', '1').lower() not in ('0', 'false', 'no')
+# Re-read rows written this close to the last sync, in case they committed late
+SYNC_OVERLAP = timedelta(seconds=5)
+# Notes embedded per search while catching up, and seconds between checks once caught up
+BACKFILL_BATCH_SIZE = 200
+BACKFILL_INTERVAL = 60
+
+
+def store_embeddings(connection, notes, embedder=None):
+    """
+    Embed notes and write their vectors, replacing any previous ones
+
+    Args:
+        connection: Session or Connection inside the caller's transaction
+        notes: List of (note_id, title, content)
+        embedder: Defaults to get_embedder()
+
+    Returns:
+        List of (note_id, vector)
+    """
+    if not notes:
+        return []
+    embedder = embedder or get_embedder()
+    vectors = embedder.embed([note_text(title, content) for _, title, content in notes])
+    note_ids = [note_id for note_id, _, _ in notes]
+    table = NoteEmbedding.__table__
+    now = datetime.utcnow()
+    connection.execute(delete(table).where(table.c.note_id.in_(note_ids), table.c.model == embedder.name))
+    connection.execute(insert(table), [
+        {'note_id': note_id, 'model': embedder.name, 'vector': to_blob(vector), 'updated_at': now}
+        for note_id, vector in zip(note_ids, vectors)
+    ])
+    return list(zip(note_ids, vectors))
+
+
+@event.listens_for(Session, 'after_flush')
+def _embed_changed_notes(session, flush_context):
+    """Re-embed notes whose title or content were written in this flush"""
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Note)]
+    if deleted:
+        table = NoteEmbedding.__table__
+        session.execute(delete(table).where(table.c.note_id.in_(deleted)))
+    if not EMBED_ON_WRITE:
+        return
+
+    def changed(note):
+        state = inspect(note)
+        return state.attrs.title.history.has_changes() or state.attrs.content.history.has_changes()
+
+    notes = [obj for obj in session.new if isinstance(obj, Note)]
+    notes += [obj for obj in session.dirty if isinstance(obj, Note) and changed(obj)]
+    if not notes:
+        return
+    try:
+        # A SAVEPOINT, so a failure rolls back only the embedding rows and
+        # leaves the note's own transaction usable
+        with session.begin_nested():
+            store_embeddings(session, [(note.id, note.title, note.content) for note in notes])
+    except Exception as e:
+        # Don't fail the save; the search backfill will embed these notes later
+        print(f"Warning: Could not embed notes: {e}")
+
+
+def _dot(a, b):
+    return sum(map(operator.mul, a, b))
+
+
+class VectorIndex:
+    """In-memory vectors of one embedder, with incremental upserts and removals"""
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = []          # row -> note id
+        self.rows = {}         # note id -> row
+        self._vectors = []     # pure-Python storage
+        self._matrix = None    # NumPy storage; capacity grows by doubling
+        self.synced_at = None
+        self.last_tombstone = 0
+        self.last_backfill = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def upsert(self, note_id, vector):
+        row = self.rows.get(note_id)
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(note_id)
+            self.rows[note_id] = row
+        if np is None:
+            if row == len(self._vectors):
+                self._vectors.append(vector)
+            else:
+                self._vectors[row] = vector
+            return
+        if self._matrix is None:
+            self._matrix = np.zeros((64, len(vector)), dtype=np.float32)
+        elif row >= len(self._matrix):
+            grown = np.zeros((len(self._matrix) * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[:len(self._matrix)] = self._matrix
+            self._matrix = grown
+        self._matrix[row] = vector
+
+    def remove(self, note_id):
+        row = self.rows.pop(note_id, None)
+        if row is None:
+            return
+        # Move the last vector into the hole so storage stays dense
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.ids[row] = moved_id
+            self.rows[moved_id] = row
+            if np is None:
+                self._vectors[row] = self._vectors[last]
+            else:
+                self._matrix[row] = self._matrix[last]
+        self.ids.pop()
+        if np is None:
+            self._vectors.pop()
+
+    def search(self, vector, k):
+        """Return up to k (note_id, score) pairs, highest cosine similarity first"""
+        count = len(self.ids)
+        if not count or k <= 0:
+            return []
+        if np is None:
+            best = heapq.nlargest(k, ((_dot(stored, vector), row) for row, stored in enumerate(self._vectors)))
+            return [(self.ids[row], float(score)) for score, row in best]
+        scores = self._matrix[:count] @ np.asarray(vector, dtype=np.float32)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+    def sync(self, session):
+        """Apply deletes and embeddings written since the last sync"""
+        table = NoteEmbedding.__table__
+        now = datetime.utcnow()
+        if self.synced_at is None:
+            # Full load: tombstones before now are already reflected in the table
+            self.last_tombstone = session.execute(select(func.max(NoteTombstone.id))).scalar() or 0
+        else:
+            # Deletes first, so a reused note id re-added below is not dropped again
+            tombstones = session.execute(
+                select(NoteTombstone.id, NoteTombstone.note_id).where(NoteTombstone.id > self.last_tombstone)
+            ).all()
+            for tombstone in tombstones:
+                self.remove(tombstone.note_id)
+                self.last_tombstone = max(self.last_tombstone, tombstone.id)
+        stmt = select(table.c.note_id, table.c.vector).where(table.c.model == self.model)
+        if self.synced_at is not None:
+            stmt = stmt.where(table.c.updated_at >= self.synced_at - SYNC_OVERLAP)
+        for row in session.execute(stmt):
+            self.upsert(row.note_id, from_blob(row.vector))
+        self.synced_at = now
+
+    def backfill(self, session, embedder):
+        """Embed one batch of notes that have no vector from this embedder"""
+        table = NoteEmbedding.__table__
+        missing = session.execute(
+            select(Note.id, Note.title, Note.content)
+            .where(~exists().where(table.c.note_id == Note.id, table.c.model == self.model))
+            .order_by(Note.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if missing:
+            for note_id, vector in store_embeddings(session, [tuple(row) for row in missing], embedder):
+                self.upsert(note_id, vector)
+            session.commit()
+        return len(missing)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(session, embedder):
+    """Return the process-wide index for the session's database and embedder"""
+    key = (str(session.get_bind().url), embedder.name)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = VectorIndex(embedder.name)
+        return _indexes[key]
+
+
+def search_similar(session, query, limit=10):
+    """
+    Find the notes closest in meaning to query
+
+    Args:
+        session: SQLAlchemy session
+        query: Free-text query
+        limit: Maximum number of results
+
+    Returns:
+        List of (note_id, score) with score the cosine similarity, best first
+    """
+    embedder = get_embedder()
+    index = get_index(session, embedder)
+    with index.lock:
+        index.sync(session)
+        if time.monotonic() - index.last_backfill > BACKFILL_INTERVAL:
+            # One batch per search bounds its latency; a full batch means more may
+            # be missing, so the next search carries on instead of waiting
+            if index.backfill(session, embedder) < BACKFILL_BATCH_SIZE:
+                index.last_backfill = time.monotonic()
+        vector = embedder.embed([query])[0]
+        return index.search(vector, limit)
@@ -0,0 +1,122 @@
+"""
+Server-sent event helpers for the streaming LLM endpoints
+
+With stream=true, /api/translate and /api/extract-structured-notes answer
+with a text/event-stream instead of one JSON body:
+
+    event: token    data: {"text": "..."}           a piece of the translation
+    event: field    data: {"name": "Title", "value": "..."}
+                                                    one extracted field, as soon as it is complete
+    event: done     data: the usual JSON response
+    event: error    data: {"error": "..."}
+
+Errors after the stream has started can't change the HTTP status, so they
+arrive as an error event instead.
+"""
+import json
+
+from flask import Response, current_app
+
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload"""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def sse_response(events):
+    """
+    Stream an iterable of formatted events to the client
+
+    The events are produced inside an app context, so the LLM cache can use
+    the app database, and proxies are told not to buffer, so each event is
+    sent as soon as it is yielded.
+    """
+    # stream_with_context() can't be used from async views: their request
+    # context belongs to another contextvars context
+    app = current_app._get_current_object()
+
+    def generate():
+        with app.app_context():
+            yield from events
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def wants_stream(data, args):
+    """True when the JSON body or the query string asks for stream=true"""
+    value = data.get('stream') if data and 'stream' in data else args.get('stream', '')
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
+
+
+class JSONFieldStream:
+    """
+    Parse a JSON object as it streams in, returning each top-level field once complete
+
+    Text before the opening brace, such as a ```json fence, is skipped. Strings,
+    lists and objects are returned as soon as they close; numbers and literals
+    once the next separator shows they can't continue. Input that stops being
+    a JSON object simply yields no more fields.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = None  # Just past the last parsed field, inside the object
+        self.closed = False
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk):
+        """
+        Add streamed text
+
+        Returns:
+            List of (name, value) for the fields completed by this chunk
+        """
+        self.buffer += chunk
+        if self.pos is None:
+            start = self.buffer.find('{')
+            if start < 0:
+                return []
+            self.pos = start + 1
+        fields = []
+        while not self.closed:
+            field = self._next_field()
+            if field is None:
+                break
+            fields.append(field)
+        return fields
+
+    def _skip(self, pos, chars=' \t\r\n'):
+        while pos < len(self.buffer) and self.buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    def _next_field(self):
+        buffer = self.buffer
+        pos = self._skip(self.pos, ' \t\r\n,')
+        if pos >= len(buffer):
+            return None
+        if buffer[pos] == '}':
+            self.closed = True
+            return None
+        try:
+            name, pos = self._decoder.raw_decode(buffer, pos)
+            pos = self._skip(pos)
+            if pos >= len(buffer):
+                return None
+            if not isinstance(name, str) or buffer[pos] != ':':
+                self.closed = True
+                return None
+            pos = self._skip(pos + 1)
+            value, end = self._decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Incomplete so far; try again with the next chunk
+            return None
+        if not isinstance(value, (str, list, dict)) and self._skip(end) >= len(buffer):
+            # A number such as "12" may still be growing
+            return None
+        self.pos = end
+        return name, value